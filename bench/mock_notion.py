@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+mock_notion.py — Notion API giả lập (local) cho benchmark
+
+- Workspace tổng hợp: số database, số dòng, số cột thừa (độ rộng property),
+  cây page lồng nhau chứa các database
+- Các endpoint mà main.py / search_database.py dùng: GET databases/pages/blocks children,
+  POST databases/{id}/query (filter, sort bỏ qua, phân trang, filter_properties), POST search
+- Bơm lỗi: độ trễ, 429 (kèm Retry-After), 5xx theo xác suất
+- Đếm request theo route, status code, số byte nhận / gửi
+"""
+import json
+import time
+import random
+import hashlib
+import threading
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+TITLE_COL = "Nội dung công việc"
+PIC_COL = "PIC"
+START_COL = "Ngày bắt đầu"
+DEADLINE_COL = "Deadline dự kiến"
+# main.py đọc "Trạng thái cuối cùng", search_database.py đọc "Tình trạng công việc trong tuần"
+STATUS_COLS = ("Trạng thái cuối cùng", "Tình trạng công việc trong tuần")
+ACTIVE = "Đang thực hiện"
+DONE = "Hoàn thành"
+EDITED = "2024-01-02T00:00:00.000Z"
+
+
+def make_id(kind: str, i: int) -> str:
+    h = hashlib.md5(f"{kind}:{i}".encode()).hexdigest()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+def _plain(s: str) -> str:
+    return s.replace("-", "").lower()
+
+def _rich(text: str) -> List[Dict[str,Any]]:
+    return [{"type": "text", "text": {"content": text, "link": None}, "annotations": {
+        "bold": False, "italic": False, "strikethrough": False, "underline": False, "code": False, "color": "default"},
+        "plain_text": text, "href": None}]
+
+
+class Workspace:
+    """Dữ liệu tổng hợp, sinh một lần (deterministic theo seed).
+
+    databases: số database; rows: số dòng mỗi database; width: số cột rich_text thừa mỗi database;
+    text_len: độ dài text mỗi ô; tree_depth / tree_fanout: cây page con chứa database (0 = không có page gốc);
+    overdue_ratio / active_ratio: tỉ lệ dòng quá hạn / đang thực hiện.
+    """
+
+    def __init__(self, databases: int = 1, rows: int = 250, width: int = 0, text_len: int = 40,
+                 tree_depth: int = 0, tree_fanout: int = 2, overdue_ratio: float = 0.5,
+                 active_ratio: float = 0.66, seed: int = 1):
+        rnd = random.Random(seed)
+        today = date.today()
+        self.databases: Dict[str, Dict[str,Any]] = {}
+        self.rows: Dict[str, List[Dict[str,Any]]] = {}
+        self.pages: Dict[str, Dict[str,Any]] = {}
+        self.children: Dict[str, List[Dict[str,Any]]] = {}
+        self.root: Optional[str] = None
+        filler = [f"Ghi chú {k}" for k in range(width)]
+        for d in range(databases):
+            dbid = make_id("db", d)
+            props = {
+                TITLE_COL: {"id": "title", "name": TITLE_COL, "type": "title", "title": {}},
+                PIC_COL: {"id": "pic", "name": PIC_COL, "type": "people", "people": {}},
+                START_COL: {"id": "st", "name": START_COL, "type": "date", "date": {}},
+                DEADLINE_COL: {"id": "dl", "name": DEADLINE_COL, "type": "date", "date": {}},
+            }
+            for k, col in enumerate(STATUS_COLS):
+                props[col] = {"id": f"s{k}", "name": col, "type": "status", "status": {"options": [
+                    {"id": "a", "name": ACTIVE, "color": "blue"}, {"id": "d", "name": DONE, "color": "green"}]}}
+            for k, col in enumerate(filler):
+                props[col] = {"id": f"f{k}", "name": col, "type": "rich_text", "rich_text": {}}
+            self.databases[_plain(dbid)] = {
+                "object": "database", "id": dbid, "created_time": EDITED, "last_edited_time": EDITED,
+                "title": _rich(f"Bench DB {d}"), "description": [], "is_inline": False,
+                "properties": props, "parent": {"type": "workspace", "workspace": True},
+                "url": f"https://www.notion.so/{_plain(dbid)}", "archived": False, "in_trash": False,
+            }
+            out = []
+            for i in range(rows):
+                active = rnd.random() < active_ratio
+                late = rnd.random() < overdue_ratio
+                deadline = today + timedelta(days=-rnd.randint(1, 60) if late else rnd.randint(1, 60))
+                status = ACTIVE if active else DONE
+                values = {
+                    TITLE_COL: {"id": "title", "type": "title", "title": _rich(f"Task {d}-{i} <{'x' * (text_len // 4)}>")},
+                    PIC_COL: {"id": "pic", "type": "people", "people": [
+                        {"object": "user", "id": make_id("user", i % 7), "name": f"User {i % 7}",
+                         "person": {"email": f"user{i % 7}@example.com"}}]},
+                    START_COL: {"id": "st", "type": "date", "date": {"start": (deadline - timedelta(days=14)).isoformat(), "end": None, "time_zone": None}},
+                    DEADLINE_COL: {"id": "dl", "type": "date", "date": {"start": deadline.isoformat(), "end": None, "time_zone": None}},
+                }
+                for k, col in enumerate(STATUS_COLS):
+                    values[col] = {"id": f"s{k}", "type": "status", "status": {"id": status[0], "name": status, "color": "blue"}}
+                for k, col in enumerate(filler):
+                    values[col] = {"id": f"f{k}", "type": "rich_text", "rich_text": _rich(rnd.choice("abcdefgh") * text_len)}
+                out.append({
+                    "object": "page", "id": make_id(f"row{d}", i), "created_time": EDITED, "last_edited_time": EDITED,
+                    "created_by": {"object": "user", "id": make_id("user", 0)},
+                    "last_edited_by": {"object": "user", "id": make_id("user", 0)},
+                    "cover": None, "icon": None, "parent": {"type": "database_id", "database_id": dbid},
+                    "archived": False, "in_trash": False, "properties": values,
+                    "url": f"https://www.notion.so/row-{i}", "public_url": None,
+                })
+            self.rows[_plain(dbid)] = out
+        if tree_depth > 0:
+            self._build_tree(tree_depth, max(1, tree_fanout))
+
+    def _add_page(self, n: int) -> str:
+        pid = make_id("page", n)
+        self.pages[_plain(pid)] = {"object": "page", "id": pid, "last_edited_time": EDITED,
+                                   "parent": {"type": "workspace", "workspace": True}, "archived": False,
+                                   "properties": {"title": {"id": "title", "type": "title", "title": _rich(f"Page {n}")}}}
+        self.children[_plain(pid)] = []
+        return pid
+
+    def _build_tree(self, depth: int, fanout: int):
+        """Page gốc -> các tầng page con; database nằm rải ở các page lá, xen với block văn bản."""
+        counter = [0]
+        def new_page():
+            counter[0] += 1
+            return self._add_page(counter[0])
+        self.root = new_page()
+        level = [self.root]
+        for _ in range(depth - 1):
+            nxt = []
+            for pid in level:
+                for _ in range(fanout):
+                    child = new_page()
+                    self.children[_plain(pid)].append({"object": "block", "id": child, "type": "child_page",
+                                                       "has_children": True, "child_page": {"title": "Sub page"}})
+                    nxt.append(child)
+            level = nxt
+        for k, dbid in enumerate(d["id"] for d in self.databases.values()):
+            leaf = level[k % len(level)]
+            self.children[_plain(leaf)].append({"object": "block", "id": dbid, "type": "child_database",
+                                                "has_children": False, "child_database": {"title": "db"}})
+        for pid in list(self.children):
+            for j in range(3):
+                self.children[pid].insert(0, {"object": "block", "id": make_id(f"p{pid}", j), "type": "paragraph",
+                                              "has_children": False, "paragraph": {"rich_text": _rich("Lorem ipsum " * 5)}})
+
+
+class Faults:
+    """Độ trễ (giây, + jitter ngẫu nhiên) và xác suất trả 429 / 5xx cho mỗi request."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, p429: float = 0.0, p5xx: float = 0.0,
+                 retry_after: float = 0.2, seed: int = 7):
+        self.latency = latency
+        self.jitter = jitter
+        self.p429 = p429
+        self.p5xx = p5xx
+        self.retry_after = retry_after
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self) -> Tuple[float, Optional[int]]:
+        with self.lock:
+            delay = self.latency + (self.rnd.uniform(0, self.jitter) if self.jitter else 0.0)
+            x = self.rnd.random()
+        if x < self.p429:
+            return delay, 429
+        if x < self.p429 + self.p5xx:
+            return delay, 503
+        return delay, None
+
+
+# ---- đánh giá filter của database query ----
+def _prop_value(page: Dict[str,Any], key: str) -> Dict[str,Any]:
+    props = page["properties"]
+    if key in props:
+        return props[key]
+    for v in props.values():
+        if v.get("id") == key:
+            return v
+    raise KeyError(key)
+
+def _match(page: Dict[str,Any], f: Optional[Dict[str,Any]]) -> bool:
+    if not f:
+        return True
+    if "and" in f:
+        return all(_match(page, x) for x in f["and"])
+    if "or" in f:
+        return any(_match(page, x) for x in f["or"])
+    if f.get("timestamp") == "last_edited_time":
+        cond = f["last_edited_time"]
+        t = page["last_edited_time"]
+        if "on_or_after" in cond:
+            return t >= cond["on_or_after"]
+        if "after" in cond:
+            return t > cond["after"]
+        return True
+    v = _prop_value(page, f["property"])
+    for t in ("status", "select"):
+        if t in f:
+            return (v.get(t) or {}).get("name") == f[t].get("equals")
+    if "rich_text" in f:
+        return "".join(x["plain_text"] for x in v.get(v["type"], [])) == f["rich_text"].get("equals")
+    if "formula" in f:
+        return False
+    if "date" in f:
+        d = (v.get("date") or {}).get("start")
+        cond = f["date"]
+        if "is_empty" in cond:
+            return not d
+        if not d:
+            return False
+        if "before" in cond:
+            return d < cond["before"]
+        if "on_or_before" in cond:
+            return d <= cond["on_or_before"]
+        if "after" in cond:
+            return d > cond["after"]
+        if "on_or_after" in cond:
+            return d >= cond["on_or_after"]
+    return True
+
+def _page_of(items: List[Any], cursor: Optional[str], size: int) -> Dict[str,Any]:
+    start = int(cursor or 0)
+    size = max(1, min(100, int(size or 100)))
+    chunk = items[start:start + size]
+    more = start + size < len(items)
+    return {"object": "list", "results": chunk, "has_more": more, "next_cursor": str(start + size) if more else None}
+
+
+class MockNotion:
+    """HTTP server Notion giả lập; base_url dùng làm NOTION_API_URL."""
+
+    def __init__(self, workspace: Workspace, faults: Optional[Faults] = None, host: str = "127.0.0.1", port: int = 0):
+        self.ws = workspace
+        self.faults = faults or Faults()
+        self.stats: Dict[str,Any] = {"requests": 0, "routes": {}, "status": {}, "bytes_in": 0, "bytes_out": 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockNotion":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, route: str, status: int, n_in: int, n_out: int):
+        with self.lock:
+            s = self.stats
+            s["requests"] += 1
+            s["routes"][route] = s["routes"].get(route, 0) + 1
+            s["status"][str(status)] = s["status"].get(str(status), 0) + 1
+            s["bytes_in"] += n_in
+            s["bytes_out"] += n_out
+
+    def route(self, method: str, path: str, query: Dict[str, List[str]], body: Dict[str,Any]) -> Tuple[str, int, Dict[str,Any]]:
+        ws = self.ws
+        parts = [p for p in path.split("/") if p][1:]  # bỏ "v1"
+        if method == "POST" and parts == ["search"]:
+            items = list(ws.databases.values())
+            return "search", 200, _page_of(items, body.get("start_cursor"), body.get("page_size", 100))
+        if len(parts) >= 2 and parts[0] == "databases":
+            dbid = _plain(parts[1])
+            if dbid not in ws.databases:
+                return "databases", 404, {"object": "error", "status": 404, "code": "object_not_found",
+                                          "message": f"Could not find database with ID: {parts[1]}."}
+            if method == "GET" and len(parts) == 2:
+                return "databases", 200, ws.databases[dbid]
+            if method == "POST" and parts[2:] == ["query"]:
+                try:
+                    rows = [r for r in ws.rows[dbid] if _match(r, body.get("filter"))]
+                except KeyError as e:
+                    return "query", 400, {"object": "error", "status": 400, "code": "validation_error",
+                                          "message": f"Could not find property with name or id: {e.args[0]}"}
+                out = _page_of(rows, body.get("start_cursor"), body.get("page_size", 100))
+                keep = query.get("filter_properties")
+                if keep:
+                    out["results"] = [dict(r, properties={k: v for k, v in r["properties"].items() if v["id"] in keep})
+                                      for r in out["results"]]
+                return "query", 200, out
+        if method == "GET" and len(parts) == 2 and parts[0] == "pages":
+            page = ws.pages.get(_plain(parts[1]))
+            if page is None:
+                return "pages", 404, {"object": "error", "status": 404, "code": "object_not_found", "message": "Not found"}
+            return "pages", 200, page
+        if method == "GET" and len(parts) == 3 and parts[0] == "blocks" and parts[2] == "children":
+            blocks = ws.children.get(_plain(parts[1]))
+            if blocks is None:
+                return "blocks", 404, {"object": "error", "status": 404, "code": "object_not_found", "message": "Not found"}
+            return "blocks", 200, _page_of(blocks, (query.get("start_cursor") or [None])[0],
+                                           (query.get("page_size") or [100])[0])
+        return "other", 404, {"object": "error", "status": 404, "code": "invalid_request_url", "message": "Invalid request URL."}
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, route: str, status: int, obj: Dict[str,Any], n_in: int, headers: Optional[Dict[str,str]] = None):
+                data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+                mock._count(route, status, n_in, len(data))
+
+            def _serve(self, method: str):
+                n = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(n) if n else b""
+                url = urlparse(self.path)
+                delay, fault = mock.faults.draw()
+                if delay:
+                    time.sleep(delay)
+                if fault == 429:
+                    return self._reply("rate_limited", 429, {"object": "error", "status": 429, "code": "rate_limited",
+                                                             "message": "Rate limited"}, n,
+                                       {"Retry-After": str(mock.faults.retry_after)})
+                if fault:
+                    return self._reply("unavailable", fault, {"object": "error", "status": fault,
+                                                              "code": "service_unavailable", "message": "Unavailable"}, n)
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    return self._reply("other", 400, {"object": "error", "status": 400, "code": "invalid_json",
+                                                      "message": "Invalid JSON"}, n)
+                route, status, obj = mock.route(method, url.path, parse_qs(url.query), body)
+                self._reply(route, status, obj, n)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+        return Handler
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+run_bench.py — benchmark offline: chạy main.py / search_database.py với Notion giả lập và SMTP sink
+
+    python bench/run_bench.py                       # mọi scenario, target main
+    python bench/run_bench.py -s wide -s flaky -t main -t search
+    python bench/run_bench.py --warm --repeat 3 --json bench.json
+
+- Mỗi lần chạy là một process riêng, thư mục làm việc tạm (cache / state trống), trừ khi --warm:
+  chạy một lượt làm nóng cache trong cùng thư mục trước lượt đo
+- Kết quả mỗi scenario: wall time, số request Notion (và 429 / 5xx), số byte nhận / gửi,
+  peak RSS của process, số email và dung lượng email
+- NOTION_RATE_LIMIT mặc định tắt (0) để đo chi phí của script thay vì giới hạn 3 request/giây;
+  đặt biến môi trường khi chạy để giữ giới hạn thật
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, Any, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from mock_notion import MockNotion, Workspace, Faults
+from smtp_sink import SmtpSink
+
+# name -> workspace (Workspace kwargs), faults (Faults kwargs), tokens (số token),
+# via_page (config trỏ tới page gốc thay vì id database)
+SCENARIOS: Dict[str, Dict[str,Any]] = {
+    "small":    {"workspace": {"databases": 1, "rows": 250}},
+    "wide":     {"workspace": {"databases": 3, "rows": 1000, "width": 30, "text_len": 80}},
+    "many-dbs": {"workspace": {"databases": 40, "rows": 120}, "tokens": 4},
+    "tree":     {"workspace": {"databases": 9, "rows": 200, "tree_depth": 3, "tree_fanout": 3}, "via_page": True},
+    "latency":  {"workspace": {"databases": 4, "rows": 600}, "faults": {"latency": 0.05, "jitter": 0.02}},
+    "flaky":    {"workspace": {"databases": 4, "rows": 600},
+                 "faults": {"latency": 0.02, "p429": 0.05, "p5xx": 0.03, "retry_after": 0.2}},
+}
+TARGETS = ("main", "search")
+RECIPIENTS = ["a@example.com", "b@example.com"]
+
+
+def write_config(path: str, ws: Workspace, smtp_port: int, tokens: int = 1, via_page: bool = False):
+    ids = [ws.root] if via_page and ws.root else [d["id"] for d in ws.databases.values()]
+    entries = [{"token": f"bench-token-{t}", "databases": []} for t in range(max(1, tokens))]
+    for k, dbid in enumerate(ids):
+        entries[k % len(entries)]["databases"].append({"id": dbid, "recipients": RECIPIENTS})
+    cfg = {"notion_tokens": entries,
+           "smtp": {"host": "127.0.0.1", "port": smtp_port, "user": "bench@example.com", "starttls": False}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, ensure_ascii=False)
+
+def child_env(notion: MockNotion, sink: SmtpSink, workdir: str, target: str) -> Dict[str,str]:
+    env = dict(os.environ)
+    env.setdefault("NOTION_RATE_LIMIT", "0")
+    env.setdefault("NOTION_BACKOFF_BASE", "0.05")
+    env.update({
+        "PYTHONPATH": REPO + os.pathsep + env.get("PYTHONPATH", ""),
+        "NOTION_API_URL": notion.base_url,
+        "NOTION_CONFIG": os.path.join(workdir, "notion_token.json"),
+        # để trống -> main.py bỏ qua cấu hình env (kể cả .env) và đọc NOTION_CONFIG
+        "NOTION_TOKEN": "", "NOTION_DATABASE_ID": "",
+        "SMTP_HOST": sink.address[0], "SMTP_PORT": str(sink.address[1]),
+        "SMTP_USER": "bench@example.com", "SMTP_PASS": "bench", "SMTP_STARTTLS": "0",
+    })
+    return env
+
+def run_child(target: str, env: Dict[str,str], workdir: str, timeout: float) -> Dict[str,Any]:
+    p = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", target], cwd=workdir, env=env,
+                       capture_output=True, text=True, timeout=timeout)
+    for line in reversed(p.stdout.splitlines()):
+        if line.startswith("BENCH "):
+            return json.loads(line[6:])
+    raise RuntimeError(f"{target} thất bại (exit {p.returncode}):\n{p.stdout[-2000:]}\n{p.stderr[-2000:]}")
+
+def child(target: str):
+    """Chạy trong process con (cwd = thư mục tạm)."""
+    t0 = time.perf_counter()
+    if target == "search":
+        import runpy
+        runpy.run_path(os.path.join(REPO, "search_database.py"), run_name="__main__")
+    else:
+        import main
+        main.main()
+    wall = time.perf_counter() - t0
+    print("BENCH " + json.dumps({"wall": wall, "rss_kb": peak_rss_kb()}))
+
+def peak_rss_kb() -> int:
+    # VmHWM bắt đầu lại sau exec; ru_maxrss trên Linux còn tính cả bộ nhớ của process cha lúc fork
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return 0
+
+def run_scenario(name: str, target: str, repeat: int = 1, warm: bool = False, timeout: float = 600) -> Dict[str,Any]:
+    sc = SCENARIOS[name]
+    ws = Workspace(**sc["workspace"])
+    runs = []
+    for _ in range(max(1, repeat)):
+        notion = MockNotion(ws, Faults(**sc.get("faults", {}))).start()
+        sink = SmtpSink().start()
+        try:
+            with tempfile.TemporaryDirectory(prefix="notion-bench-") as workdir:
+                write_config(os.path.join(workdir, "notion_token.json"), ws, sink.address[1],
+                             sc.get("tokens", 1), sc.get("via_page", False))
+                env = child_env(notion, sink, workdir, target)
+                if warm:
+                    run_child(target, env, workdir, timeout)
+                    notion.stats = {"requests": 0, "routes": {}, "status": {}, "bytes_in": 0, "bytes_out": 0}
+                    sink.stats = dict.fromkeys(sink.stats, 0)
+                res = run_child(target, env, workdir, timeout)
+        finally:
+            notion.stop()
+            sink.stop()
+        runs.append({"wall": res["wall"], "rss_kb": res["rss_kb"], "notion": notion.stats, "smtp": sink.stats})
+    mid = sorted(runs, key=lambda r: r["wall"])[len(runs) // 2]
+    return {
+        "scenario": name, "target": target, "warm": warm, "runs": len(runs),
+        "wall_s": round(statistics.median(r["wall"] for r in runs), 4),
+        "requests": mid["notion"]["requests"],
+        "http_429": mid["notion"]["status"].get("429", 0),
+        "http_5xx": sum(v for k, v in mid["notion"]["status"].items() if k.startswith("5")),
+        "routes": mid["notion"]["routes"],
+        "kb_in": round(mid["notion"]["bytes_out"] / 1024, 1),
+        "kb_out": round(mid["notion"]["bytes_in"] / 1024, 1),
+        "peak_rss_mb": round(max(r["rss_kb"] for r in runs) / 1024, 1),
+        "emails": mid["smtp"]["messages"],
+        "smtp_connections": mid["smtp"]["connections"],
+        "email_kb": round(mid["smtp"]["bytes"] / 1024, 1),
+    }
+
+def print_table(results: List[Dict[str,Any]]):
+    cols = ("scenario", "target", "wall_s", "requests", "http_429", "http_5xx", "kb_in", "kb_out",
+            "peak_rss_mb", "emails", "email_kb")
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in cols]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(cols, widths)))
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Benchmark offline cho Notion overdue mailer")
+    ap.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="mặc định: tất cả")
+    ap.add_argument("-t", "--target", action="append", choices=TARGETS, help="mặc định: main")
+    ap.add_argument("--repeat", type=int, default=1, help="số lần đo mỗi scenario (lấy median)")
+    ap.add_argument("--warm", action="store_true", help="đo lượt chạy thứ hai (cache schema / page / state đã có)")
+    ap.add_argument("--json", help="ghi kết quả ra file JSON")
+    ap.add_argument("--child", choices=TARGETS, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.child:
+        child(args.child)
+        return
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        for target in args.target or ["main"]:
+            print(f"... {name} / {target}", file=sys.stderr)
+            results.append(run_scenario(name, target, args.repeat, args.warm))
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+smtp_sink.py — SMTP server local nhận và bỏ mọi email (cho benchmark)
+
+- Đủ lệnh cho smtplib: EHLO/HELO, AUTH PLAIN (chấp nhận mọi mật khẩu), MAIL, RCPT, DATA, RSET, NOOP, QUIT
+- Không có STARTTLS: dùng với smtp_cfg {"starttls": false} (hoặc SMTP_STARTTLS=0)
+- Đếm số kết nối, số email, số người nhận, số byte
+"""
+import socketserver
+import threading
+from typing import Dict, Any, Optional
+
+
+class SmtpSink:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.stats: Dict[str,Any] = {"connections": 0, "messages": 0, "recipients": 0, "bytes": 0}
+        self.lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def start(self) -> "SmtpSink":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _add(self, **kv: int):
+        with self.lock:
+            for k, v in kv.items():
+                self.stats[k] += v
+
+    def _handler(self):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                sink._add(connections=1)
+                self.reply("220 bench-sink ESMTP")
+                rcpts = 0
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    cmd = line.decode("utf-8", "replace").strip()
+                    verb = cmd.split(" ", 1)[0].upper()
+                    if verb == "EHLO":
+                        self.wfile.write(b"250-bench-sink\r\n250-8BITMIME\r\n250-AUTH PLAIN\r\n250 SIZE 52428800\r\n")
+                    elif verb == "AUTH":
+                        self.reply("235 Authentication successful")
+                    elif verb in ("HELO", "NOOP"):
+                        self.reply("250 OK")
+                    elif verb in ("MAIL", "RSET"):
+                        rcpts = 0
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        rcpts += 1
+                        self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        size = 0
+                        while True:
+                            chunk = self.rfile.readline()
+                            if not chunk or chunk in (b".\r\n", b".\n"):
+                                break
+                            size += len(chunk)
+                        sink._add(messages=1, recipients=rcpts, bytes=size)
+                        rcpts = 0
+                        self.reply("250 OK queued")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        return Handler
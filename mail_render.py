@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+mail_render.py — dựng HTML email gọn, có giới hạn dung lượng
+
+- Một stylesheet dùng chung trong <head> thay vì style lặp lại trên từng ô
+- Mọi giá trị đều được escape
+- MAIL_HTML_BUDGET: số byte HTML tối đa của một email (Gmail cắt email có HTML quá ~102 KB).
+  Vượt ngưỡng: bảng lớn nhất được thay bằng bảng tóm tắt theo PIC, danh sách đầy đủ
+  đi kèm dưới dạng file CSV đính kèm
+- Dùng chung bởi main.py và search_database.py
+"""
+import os
+import csv
+import io
+from html import escape
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+MAIL_HTML_BUDGET = int(os.getenv("MAIL_HTML_BUDGET", "80000"))  # byte, 0 = không giới hạn
+CSV_NAME = os.getenv("MAIL_CSV_NAME", "notion_cong_viec.csv")
+
+COLUMNS = ("PIC", "Start", "Deadline", "Trạng thái", "Nội dung công việc")
+STYLE = ("<style>table.nt{border-collapse:collapse;width:100%}"
+         ".nt th,.nt td{border:1px solid #000;padding:6px}</style>")
+EMPTY = "<p>Không có công việc quá hạn 🎉</p>"
+
+
+class Table(NamedTuple):
+    """Một bảng công việc trong email; title dùng cho ghi chú tóm tắt và cột "Mục" của CSV."""
+    title: str
+    rows: Sequence[Sequence[str]]
+
+# Nội dung email: HTML đã escape sẵn hoặc bảng (render lúc gửi, theo ngân sách byte)
+Part = Union[str, Table]
+
+
+def table_html(rows: Iterable[Sequence[str]], columns: Sequence[str] = COLUMNS) -> str:
+    body = "".join("<tr>" + "".join(f"<td>{escape(str(v))}</td>" for v in r) + "</tr>" for r in rows)
+    if not body:
+        return EMPTY
+    head = "".join(f"<th>{escape(c)}</th>" for c in columns)
+    return f"<table class=\"nt\"><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+def summary_html(t: Table) -> str:
+    """Tóm tắt theo PIC: số công việc và deadline sớm nhất."""
+    by_pic: Dict[str, List[Any]] = {}
+    for r in t.rows:
+        s = by_pic.setdefault(r[0] or "(chưa có PIC)", [0, ""])
+        s[0] += 1
+        if r[2] and (not s[1] or r[2] < s[1]):
+            s[1] = r[2]
+    rows = sorted(((pic, str(n), dl) for pic, (n, dl) in by_pic.items()), key=lambda x: (-int(x[1]), x[0]))
+    note = (f"<p><i>{len(t.rows)} công việc — quá dài để hiển thị trong email, "
+            f"danh sách đầy đủ trong file đính kèm {escape(CSV_NAME)}.</i></p>")
+    return note + table_html(rows, ("PIC", "Số công việc", "Deadline sớm nhất"))
+
+def csv_bytes(tables: Iterable[Table]) -> bytes:
+    """CSV (UTF-8 có BOM để Excel đọc đúng tiếng Việt), ghi từng dòng vào buffer."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(("Mục",) + COLUMNS)
+    for t in tables:
+        for r in t.rows:
+            w.writerow((t.title,) + tuple(r))
+    return buf.getvalue().encode("utf-8-sig")
+
+def render(parts: Sequence[Part], budget: Optional[int] = None) -> Tuple[str, Optional[Tuple[str, bytes]]]:
+    """(HTML hoàn chỉnh, (tên file, CSV) | None).
+
+    Nếu vượt budget: thay lần lượt bảng lớn nhất bằng bảng tóm tắt cho tới khi vừa,
+    các bảng bị thay được ghi đầy đủ vào CSV đính kèm.
+    """
+    budget = MAIL_HTML_BUDGET if budget is None else budget
+    html = [p if isinstance(p, str) else table_html(p.rows) for p in parts]
+    sizes = [len(h.encode("utf-8")) for h in html]
+    total = sum(sizes) + len(STYLE) + 64
+    overflow: List[Table] = []
+    if budget and total > budget:
+        tables = sorted((i for i, p in enumerate(parts) if isinstance(p, Table) and p.rows), key=lambda i: -sizes[i])
+        for i in tables:
+            if total <= budget:
+                break
+            short = summary_html(parts[i])
+            total += len(short.encode("utf-8")) - sizes[i]
+            html[i] = short
+            overflow.append(parts[i])
+    page = f"<html><head><meta charset=\"utf-8\">{STYLE}</head><body>{''.join(html)}</body></html>"
+    if not overflow:
+        return page, None
+    # giữ thứ tự xuất hiện trong email
+    overflow.sort(key=lambda t: next(i for i, p in enumerate(parts) if p is t))
+    return page, (CSV_NAME, csv_bytes(overflow))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+mailer.py — gửi nhiều email qua một kết nối SMTP dùng chung
+
+- Một lần starttls() + login() cho cả lần chạy thay vì cho từng email
+- Tự kết nối lại khi server ngắt (SMTPServerDisconnected)
+- Giới hạn số email trên một kết nối (Gmail hay từ chối kết nối giữ quá lâu)
+- build_message(): email HTML, kèm file đính kèm (vd. CSV) nếu có
+- smtp_cfg {"starttls": false} (hoặc SMTP_STARTTLS=0) và bỏ "pass" để chạy với SMTP server local
+  (vd. python -m aiosmtpd -n -l localhost:8025)
+"""
+import os
+import smtplib
+import threading
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, Any, List, Optional, Tuple
+
+SMTP_MAX_PER_CONN = int(os.getenv("SMTP_MAX_PER_CONN", "50"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "60"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1").lower() not in ("0", "false", "no")
+
+
+def build_message(subject: str, from_addr: str, to_list: List[str], html: str,
+                  attachment: Optional[Tuple[str, bytes]] = None) -> str:
+    """attachment: (tên file, nội dung)."""
+    msg = MIMEMultipart("mixed" if attachment else "alternative")
+    msg["Subject"] = subject
+    msg["From"] = from_addr
+    msg["To"] = ", ".join(to_list)
+    msg.attach(MIMEText(html, "html", "utf-8"))
+    if attachment:
+        name, data = attachment
+        part = MIMEApplication(data, "csv" if name.endswith(".csv") else "octet-stream")
+        part.add_header("Content-Disposition", "attachment", filename=name)
+        msg.attach(part)
+    return msg.as_string()
+
+
+class MailDispatcher:
+    """Giữ một kết nối SMTP đã xác thực; thread-safe, email gửi tuần tự theo thứ tự gọi."""
+
+    def __init__(self, smtp_cfg: Dict[str,Any], max_per_conn: Optional[int] = None):
+        self.cfg = smtp_cfg
+        self.max_per_conn = max_per_conn or int(smtp_cfg.get("max_per_connection", SMTP_MAX_PER_CONN))
+        self.conn: Optional[smtplib.SMTP] = None
+        self.sent_on_conn = 0
+        self.sent = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        s = smtplib.SMTP(self.cfg.get("host", "smtp.gmail.com"), int(self.cfg.get("port", 587)), timeout=SMTP_TIMEOUT)
+        try:
+            if self.cfg.get("starttls", SMTP_STARTTLS):
+                s.starttls()
+            if self.cfg.get("user") and self.cfg.get("pass"):
+                s.login(self.cfg["user"], self.cfg["pass"])
+        except Exception:
+            s.close()
+            raise
+        self.conn = s
+        self.sent_on_conn = 0
+        self.connections += 1
+
+    def _disconnect(self):
+        if self.conn is None:
+            return
+        try:
+            self.conn.quit()
+        except (smtplib.SMTPException, OSError):
+            self.conn.close()
+        self.conn = None
+
+    def send(self, from_addr: str, to_list: List[str], msg: str):
+        with self.lock:
+            if self.conn is not None and self.sent_on_conn >= self.max_per_conn:
+                self._disconnect()
+            for attempt in (0, 1):
+                if self.conn is None:
+                    self._connect()
+                try:
+                    self.conn.sendmail(from_addr, to_list, msg)
+                    break
+                except smtplib.SMTPServerDisconnected:
+                    # server đóng kết nối (idle timeout / giới hạn): kết nối lại một lần
+                    self.conn = None
+                    if attempt:
+                        raise
+            self.sent_on_conn += 1
+            self.sent += 1
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -8,14 +8,28 @@ main.py — Notion overdue mailer (Environment Variables)
 """
 import os
 import re
+import sys
+import signal
 import json
+import hashlib
 import smtplib
-from typing import Optional, Tuple, Dict, Any, List
-from datetime import datetime, timezone
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Tuple, Dict, Any, List, Iterable, Iterator, NamedTuple, Union
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 import requests
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from dotenv import load_dotenv
+from notion_client import get_client, close_clients, reset_budgets, decode, paginate, add_request_hook
+from html import escape
+from mailer import MailDispatcher, build_message
+from mail_render import Part, Table, render, table_html
+from row_store import RowStore
+from run_stats import STATS, profile, token_key
+from scheduler import CronSchedule
+from notion_props import Extractor, schema_types, first_key, keys_of_type, read_text, read_people_listed, read_choice, read_date10, read_formula
 
 # Load environment variables
 load_dotenv()
@@ -60,6 +74,33 @@ SMTP_PASS = os.getenv("SMTP_PASS")
 
 # Fallback config path (nếu cần)
 CONFIG_PATH = os.getenv("NOTION_CONFIG", "notion_token.json")
+# Gửi một email tổng hợp cho mỗi người nhận thay vì một email cho mỗi database
+DIGEST_MODE = os.getenv("NOTION_DIGEST", "").lower() in ("1", "true", "yes")
+# Khi nào gửi email: always (mỗi lần chạy), changed (chỉ khi tập quá hạn / đang thực hiện đổi),
+# delta (chỉ gửi phần mới quá hạn / không còn quá hạn)
+NOTIFY_MODE = os.getenv("NOTION_NOTIFY_MODE", "always").lower()
+NOTIFY_STATE_PATH = os.getenv("NOTION_NOTIFY_STATE", ".notion_notify_state.json")
+# Chế độ incremental: chỉ query page sửa từ lần chạy trước, phần còn lại lấy từ SQLite
+INCREMENTAL_MODE = os.getenv("NOTION_INCREMENTAL", "").lower() in ("1", "true", "yes")
+ROW_STORE_PATH = os.getenv("NOTION_ROW_STORE", ".notion_rows.sqlite")
+INCREMENTAL_OVERLAP_MIN = float(os.getenv("NOTION_INCREMENTAL_OVERLAP_MIN", "2"))
+# Chu kỳ (giờ) quét id để dọn page đã archive / xóa khỏi kho
+RECONCILE_HOURS = float(os.getenv("NOTION_RECONCILE_HOURS", "24"))
+# Số database xử lý song song (1 = tuần tự)
+NOTION_WORKERS = max(1, int(os.getenv("NOTION_WORKERS", "4")))
+# Số request /blocks/{id}/children song song khi duyệt một page
+NOTION_WALK_WORKERS = max(1, int(os.getenv("NOTION_WALK_WORKERS", "4")))
+# Số worker tối đa dùng cùng một token cùng lúc (0 = không giới hạn ngoài NOTION_WORKERS)
+NOTION_WORKERS_PER_TOKEN = max(0, int(os.getenv("NOTION_WORKERS_PER_TOKEN", "0")))
+# Daemon (NOTION_DAEMON=1): chạy theo lịch cron trong cùng process, giữ kết nối / cache giữa các lần
+DAEMON_MODE = os.getenv("NOTION_DAEMON", "").lower() in ("1", "true", "yes")
+NOTION_SCHEDULE = os.getenv("NOTION_SCHEDULE", "0 * * * *")
+NOTION_SCHEDULE_TZ = os.getenv("NOTION_SCHEDULE_TZ", "Asia/Ho_Chi_Minh")
+NOTION_RUN_ON_START = os.getenv("NOTION_RUN_ON_START", "").lower() in ("1", "true", "yes")
+# Thời gian (giây) tin dùng cache page -> database nếu page không đổi last_edited_time
+PAGE_CACHE_TTL = float(os.getenv("NOTION_PAGE_CACHE_TTL", "86400"))
+# Cache schema trên đĩa giữa các lần chạy ("" để tắt)
+SCHEMA_CACHE_PATH = os.getenv("NOTION_SCHEMA_CACHE", ".notion_schema_cache.json")
 DEFAULT_STATUS_EQUALS = "Đang thực hiện"
 
 TITLE_CANDS    = ["Nội dung công việc", "Mục tiêu, hiệu quả dự án","Chi tiết công việc"]
@@ -69,13 +110,6 @@ DEADLINE_CANDS = ["Deadline dự kiến", "Deadline", "Due date", "Due", "Ngày
 STATUS_CANDS   = ["Trạng thái cuối cùng", "Tình trạng công việc trong tuần", "Tình trạng", "Status"]
 
 
-def _headers(token: str) -> Dict[str,str]:
-    return {
-        "Authorization": f"Bearer {token}",
-        "Notion-Version": "2022-06-28",
-        "Content-Type": "application/json",
-    }
-
 def _extract_uuid(s: str) -> Optional[str]:
     if not s:
         return None
@@ -85,67 +119,217 @@ def _extract_uuid(s: str) -> Optional[str]:
     m = re.search(r"([0-9a-fA-F]{32}|[0-9a-fA-F-]{36})$", s)
     return m.group(1).replace("-", "").lower() if m else None
 
-def resolve_db_ids(token: str, raw: str, max_depth: int = 3) -> List[str]:
+# Block không thể chứa database: không cần gọi /children
+_NO_DB_BLOCKS = {
+    "child_database", "table", "table_row", "code", "equation", "image", "video", "audio",
+    "file", "pdf", "bookmark", "embed", "divider", "breadcrumb", "table_of_contents",
+    "link_preview", "link_to_page", "unsupported",
+}
+
+def _block_children(token: str, block_id: str) -> List[Dict[str,Any]]:
+    c = get_client(token)
+    out: List[Dict[str,Any]] = []
+    cursor = None
+    while True:
+        params = {"page_size": 100}
+        if cursor:
+            params["start_cursor"] = cursor
+        rr = c.get(f"/blocks/{block_id}/children", params=params)
+        rr.raise_for_status()
+        data = decode(rr, "blocks")
+        out.extend(data.get("results", []))
+        if not data.get("has_more"):
+            break
+        cursor = data.get("next_cursor")
+    return out
+
+def _walk_databases(token: str, root_id: str, max_depth: int, max_dbs: Optional[int] = None) -> List[str]:
+    """Duyệt cây block theo chiều rộng; các block cùng tầng được lấy song song.
+
+    Kết quả được sắp lại theo thứ tự duyệt chiều sâu (như walk() cũ) nhờ đường dẫn chỉ số của từng block,
+    để thứ tự report / email không đổi.
+    """
+    hits: List[Tuple[Tuple[int, ...], str]] = []
+    seen = set()
+    level: List[Tuple[str, Tuple[int, ...]]] = [(root_id, ())]
+    depth = max_depth
+    pool = ThreadPoolExecutor(max_workers=NOTION_WALK_WORKERS)
+    try:
+        while level and depth >= 0:
+            nxt = []
+            results = pool.map(lambda item: _block_children(token, item[0]), level)
+            for (_, path), blocks in zip(level, results):
+                for i, b in enumerate(blocks):
+                    t = b.get("type")
+                    did = None
+                    if t == "child_database":
+                        did = b["id"]
+                    elif t == "link_to_database":
+                        did = (b.get(t) or {}).get("database_id")
+                    if did:
+                        did = did.replace("-", "").lower()
+                        hits.append((path + (i,), did))
+                        seen.add(did)
+                        if max_dbs and len(seen) >= max_dbs:
+                            return _dfs_order(hits)
+                    if b.get("has_children") and t not in _NO_DB_BLOCKS:
+                        nxt.append((b["id"], path + (i,)))
+            level = nxt
+            depth -= 1
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return _dfs_order(hits)
+
+def _dfs_order(hits: List[Tuple[Tuple[int, ...], str]]) -> List[str]:
+    # block cha đứng trước con, anh em theo thứ tự: đúng thứ tự tiền tố của đường dẫn; giữ lần xuất hiện đầu
+    return list(dict.fromkeys(did for _, did in sorted(hits)))
+
+def resolve_db_ids(token: str, raw: str, max_depth: int = 3, max_dbs: Optional[int] = None) -> List[str]:
     """Return list of database ids (32-hex, no dashes). Accepts page/db URL or id."""
+    with STATS.timed("resolve", _extract_uuid(raw) or raw):
+        return _resolve_db_ids(token, raw, max_depth, max_dbs)
+
+def _resolve_db_ids(token: str, raw: str, max_depth: int, max_dbs: Optional[int]) -> List[str]:
     uid = _extract_uuid(raw)
     if not uid:
         raise ValueError(f"Không trích được UUID từ: {raw}")
-    h = _headers(token)
-    r = requests.get(f"https://api.notion.com/v1/databases/{uid}", headers=h)
-    if r.status_code == 200:
+    if uid in _DB_META or uid in _SCHEMA_CACHE:
         return [uid]
-    r = requests.get(f"https://api.notion.com/v1/pages/{uid}", headers=h)
+    c = get_client(token)
+    cached_page = _PAGE_CACHE.get(uid)
+    if cached_page is None:
+        r = c.get(f"/databases/{uid}")
+        if r.status_code == 200:
+            _remember_db(uid, decode(r))
+            return [uid]
+    r = c.get(f"/pages/{uid}")
     if r.status_code != 200:
         raise ValueError("Không phải database/page hoặc token không có quyền.")
-    def walk(block_id: str, depth: int) -> List[str]:
-        if depth < 0:
-            return []
-        out: List[str] = []
-        cursor = None
-        while True:
-            params = {"page_size": 100}
-            if cursor:
-                params["start_cursor"] = cursor
-            rr = requests.get(f"https://api.notion.com/v1/blocks/{block_id}/children", headers=h, params=params)
-            rr.raise_for_status()
-            data = rr.json()
-            for b in data.get("results", []):
-                t = b.get("type")
-                if t == "child_database":
-                    out.append(b["id"].replace("-", "").lower())
-                elif t == "link_to_database":
-                    did = b[t].get("database_id")
-                    if did:
-                        out.append(did.replace("-", "").lower())
-                if b.get("has_children"):
-                    out += walk(b["id"], depth - 1)
-            if not data.get("has_more"):
-                break
-            cursor = data.get("next_cursor")
-        # unique
-        seen = {}
-        return [seen.setdefault(x, x) for x in out if x not in seen]
-    ids = walk(uid, max_depth)
+    edited = decode(r).get("last_edited_time")
+    if (cached_page and cached_page.get("last_edited_time") == edited
+            and cached_page.get("max_depth") == max_depth and cached_page.get("max_dbs") == max_dbs
+            and time.time() - cached_page.get("walked_at", 0) < PAGE_CACHE_TTL):
+        return list(cached_page["databases"])
+    ids = _walk_databases(token, uid, max_depth, max_dbs)
     if not ids:
         raise ValueError("Page không chứa database (hoặc chưa Add connection).")
+    if SCHEMA_CACHE_PATH:
+        _PAGE_CACHE[uid] = {"last_edited_time": edited, "max_depth": max_depth, "max_dbs": max_dbs,
+                            "walked_at": time.time(), "databases": ids}
     return ids
 
-def _get_db_props(token: str, dbid: str) -> Dict[str,Any]:
-    r = requests.get(f"https://api.notion.com/v1/databases/{dbid}", headers=_headers(token))
+# Cache metadata database trong một lần chạy: dbid -> properties, title, cột đã chọn
+_DB_META: Dict[str, Dict[str,Any]] = {}
+# Cache schema đọc từ đĩa (cùng định dạng với _DB_META), xác thực lại bằng last_edited_time
+_SCHEMA_CACHE: Dict[str, Dict[str,Any]] = {}
+# token -> {dbid: database object} từ /v1/search, lấy một lần mỗi lần chạy
+_TOKEN_DBS: Dict[str, Dict[str, Dict[str,Any]]] = {}
+# (database, người nhận) -> fingerprint của lần gửi gần nhất
+_NOTIFY_STATE: Dict[str, Dict[str,Any]] = {}
+# page id -> database tìm được khi duyệt page, lưu cùng file cache schema
+_PAGE_CACHE: Dict[str, Dict[str,Any]] = {}
+# dbid -> (metadata đã dùng để biên dịch, Extractor)
+_EXTRACTORS: Dict[str, Tuple[Dict[str,Any], Extractor]] = {}
+_TOKEN_DBS_LOCKS: Dict[str, threading.Lock] = {}
+
+def _remember_db(dbid: str, obj: Dict[str,Any]) -> Dict[str,Any]:
+    meta = {
+        "properties": {name: {"id": p.get("id"), "type": p.get("type")} for name, p in (obj.get("properties") or {}).items()},
+        "title": "".join(t.get("plain_text", "") for t in (obj.get("title") or [])),
+        "last_edited_time": obj.get("last_edited_time"),
+        "resolved": {},
+    }
+    _DB_META[dbid] = meta
+    if SCHEMA_CACHE_PATH:
+        _SCHEMA_CACHE[dbid] = meta
+    return meta
+
+def _token_databases(token: str) -> Dict[str, Dict[str,Any]]:
+    """Mọi database mà token thấy được, qua /v1/search (vài request cho cả workspace)."""
+    with _TOKEN_DBS_LOCKS.setdefault(token, threading.Lock()):
+        return _TOKEN_DBS[token] if token in _TOKEN_DBS else _list_databases(token)
+
+def _list_databases(token: str) -> Dict[str, Dict[str,Any]]:
+    dbs = {}
+    c = get_client(token)
+    payload = {"filter": {"property": "object", "value": "database"}, "page_size": 100}
+    def fetch(cursor):
+        body = dict(payload)
+        if cursor:
+            body["start_cursor"] = cursor
+        r = c.post("/search", json=body)
+        r.raise_for_status()
+        return decode(r)
+    try:
+        for data in paginate(fetch):
+            for obj in data.get("results", []):
+                dbs[obj["id"].replace("-", "").lower()] = obj
+    except (requests.RequestException, ValueError, KeyError) as e:
+        print(f"Không liệt kê được database qua /search: {e}")
+    _TOKEN_DBS[token] = dbs
+    return dbs
+
+def _get_db_meta(token: str, dbid: str) -> Dict[str,Any]:
+    meta = _DB_META.get(dbid)
+    if meta is not None:
+        return meta
+    cached = _SCHEMA_CACHE.get(dbid)
+    if cached is not None:
+        listed = _token_databases(token).get(dbid)
+        if listed is not None:
+            if listed.get("last_edited_time") == cached.get("last_edited_time"):
+                _DB_META[dbid] = cached
+                return cached
+            # schema có thể đã đổi: /search đã trả về object đầy đủ, không cần GET thêm
+            return _remember_db(dbid, listed)
+    r = get_client(token).get(f"/databases/{dbid}")
     r.raise_for_status()
-    return r.json().get("properties", {})
+    return _remember_db(dbid, decode(r))
+
+def _get_db_props(token: str, dbid: str) -> Dict[str,Any]:
+    return _get_db_meta(token, dbid)["properties"]
 
 def _db_title(token: str, dbid: str) -> str:
     try:
-        r = requests.get(f"https://api.notion.com/v1/databases/{dbid}", headers=_headers(token))
-        if r.status_code != 200:
-            return dbid
-        obj = r.json()
-        title = "".join(t.get("plain_text", "") for t in (obj.get("title") or []))
-        return title or dbid
+        return _get_db_meta(token, dbid)["title"] or dbid
     except Exception:
         return dbid
 
+def clear_db_cache():
+    _DB_META.clear()
+    _EXTRACTORS.clear()
+    _TOKEN_DBS.clear()
+
+def refresh_db_cache():
+    """Daemon: giữ schema đã biết trong bộ nhớ nhưng xác thực lại (qua /v1/search) ở lần chạy kế."""
+    _SCHEMA_CACHE.update(_DB_META)
+    _DB_META.clear()
+    _TOKEN_DBS.clear()
+
+def load_schema_cache(path: str = SCHEMA_CACHE_PATH):
+    _SCHEMA_CACHE.clear()
+    _PAGE_CACHE.clear()
+    if not path or not os.path.exists(path):
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        _SCHEMA_CACHE.update(data.get("databases", {}))
+        _PAGE_CACHE.update(data.get("pages", {}))
+    except (json.JSONDecodeError, OSError, AttributeError) as e:
+        print(f"Warning: Could not load schema cache {path}: {e}")
+
+def save_schema_cache(path: str = SCHEMA_CACHE_PATH):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "databases": _SCHEMA_CACHE, "pages": _PAGE_CACHE}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Warning: Could not write schema cache {path}: {e}")
+
 def _normalize(s: str) -> str:
     return " ".join((s or "").split()).lower()
 
@@ -233,7 +417,39 @@ def _any_title(props: Dict[str,Any]) -> str:
             return t
     return ""
 
-def cell_text(props: Dict[str,Any]) -> tuple[str,str,str,str,str]:
+# (pic, start, deadline, status, name) — 5 cột hiển thị của một dòng
+Cells = Tuple[str,str,str,str,str]
+
+CELL_FIELDS = ("pic", "start", "deadline", "status", "name")
+
+def compile_extractor(props: Dict[str,Any]) -> Extractor:
+    """cell_text đã biên dịch cho một database: cùng quy tắc chọn cột, nhưng chỉ chọn một lần theo schema."""
+    types = schema_types(props)
+    titles = keys_of_type(types, ("title",))
+    if titles:
+        name = [(titles[0], read_text, True)]
+    else:
+        name = [(k, read_text, False) for k in TITLE_CANDS if types.get(k) in ("title", "rich_text")]
+    pic = []
+    k = first_key(types, PIC_CANDS)
+    if k and types[k] == "people":
+        pic.append((k, read_people_listed, True))
+    elif k and types[k] == "select":
+        pic.append((k, read_choice, True))
+    pic += [(kk, read_people_listed, True) for kk in keys_of_type(types, ("people",))]
+    def date_col(names: List[str]):
+        kk = first_key(types, names, ("date",)) or next(iter(keys_of_type(types, ("date",))), None)
+        return [(kk, read_date10, True)] if kk else []
+    k = first_key(types, STATUS_CANDS)
+    if not k or types[k] not in ("status", "select"):
+        k = next(iter(keys_of_type(types, ("status", "select"))), None)
+    status = [(k, read_choice, True)] if k else []
+    return Extractor({"pic": pic, "start": date_col(START_CANDS), "deadline": date_col(DEADLINE_CANDS),
+                      "status": status, "name": name}, CELL_FIELDS)
+
+def cell_text(props: Dict[str,Any], ex: Optional[Extractor] = None) -> Cells:
+    if ex is not None:
+        return ex.extract(props)
     name  = _any_title(props)
     pic   = _any_people(props)
     start = _any_date(props, START_CANDS)
@@ -241,15 +457,51 @@ def cell_text(props: Dict[str,Any]) -> tuple[str,str,str,str,str]:
     stt   = _any_status(props)
     return pic, start, dl, stt, name
 
-def query_overdue(token: str, database_id: str, schema: Optional[Dict[str,str]] = None, status_equals: Optional[str] = DEFAULT_STATUS_EQUALS) -> List[Dict[str,Any]]:
-    props = _get_db_props(token, database_id)
-    # Deadline
+def _parse_date(s: str) -> Optional[date]:
+    try:
+        return date.fromisoformat(s[:10]) if s else None
+    except ValueError:
+        return None
+
+class Row(NamedTuple):
+    """Một dòng công việc đã chiếu từ page Notion; mọi bước sau fetch dùng kiểu này."""
+    page_id: str
+    last_edited_time: str
+    pic: str
+    start: str
+    deadline: str
+    status: str
+    name: str
+    due: Optional[date]
+
+    @property
+    def cells(self) -> Cells:
+        return self.pic, self.start, self.deadline, self.status, self.name
+
+def to_row(page: Dict[str,Any], deadline_prop: Optional[Dict[str,str]] = None, ex: Optional[Extractor] = None) -> Row:
+    """Chiếu page sang Row; due lấy từ cột deadline đã resolve (nếu có), không thì từ cột hiển thị."""
+    props = page.get("properties", {})
+    pic, start, dl, stt, name = cell_text(props, ex)
+    if deadline_prop:
+        v = props.get(deadline_prop["name"]) or {}
+        due = _parse_date((v.get("date") or {}).get("start") or "")
+    else:
+        due = _parse_date(dl)
+    return Row(page.get("id", ""), page.get("last_edited_time", ""), pic, start, dl, stt, name, due)
+
+def _with_text_status(row: Row, page: Dict[str,Any], plan: "StatusPlan") -> Row:
+    # extractor chỉ đọc cột status/select: trạng thái là cột formula / rich_text thì lấy theo plan
+    if plan.text_cols and not row.status:
+        return row._replace(status=plan.status_of(page))
+    return row
+
+def _resolve_deadline_prop(props: Dict[str,Any], schema: Optional[Dict[str,str]] = None) -> Optional[Dict[str,str]]:
     if schema and schema.get("deadline") in props and props[schema["deadline"]]["type"] == "date":
         meta = props[schema["deadline"]]
-        deadline_prop = {"name": schema["deadline"], "id": meta["id"], "type": "date"}
-    else:
-        deadline_prop = _pick_deadline_col(props)
-    # Status
+        return {"name": schema["deadline"], "id": meta["id"], "type": "date"}
+    return _pick_deadline_col(props)
+
+def _resolve_status_prop(props: Dict[str,Any], schema: Optional[Dict[str,str]] = None) -> Optional[Dict[str,str]]:
     status_prop = None
     if schema and schema.get("status"):
         status_prop = _find_prop_by_name(props, schema["status"], want_types=("status","select"))
@@ -263,118 +515,225 @@ def query_overdue(token: str, database_id: str, schema: Optional[Dict[str,str]]
                 if meta.get("type") in ("status","select"):
                     status_prop = {"name": name, "id": meta["id"], "type": meta["type"]}
                     break
-    today_iso = datetime.now(timezone.utc).date().isoformat()
-    url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    filters = []
-    if deadline_prop:
-        filters.append({"property": deadline_prop["id"], "date": {"before": today_iso}})
-    payload = {"page_size": 100}
-    if status_equals and status_prop:
-        operator = status_prop["type"]
-        filters.append({"property": status_prop["id"], operator: {"equals": status_equals}})
-    if filters:
-        payload["filter"] = {"and": filters}
-    rows: List[Dict[str,Any]] = []
-    cursor = None
-    while True:
+    return status_prop
+
+def _schema_key(schema: Optional[Dict[str,str]]) -> str:
+    return f"{(schema or {}).get('deadline') or ''}|{(schema or {}).get('status') or ''}"
+
+def _resolve_cols(token: str, database_id: str, schema: Optional[Dict[str,str]] = None) -> Tuple[Optional[Dict[str,str]], Optional[Dict[str,str]]]:
+    """(deadline_prop, status_prop) của database, tính một lần cho mỗi schema override."""
+    with STATS.timed("schema", database_id):
+        meta = _get_db_meta(token, database_id)
+        key = _schema_key(schema)
+        cols = meta["resolved"].get(key)
+        if cols is None:
+            props = meta["properties"]
+            cols = meta["resolved"][key] = (_resolve_deadline_prop(props, schema), _resolve_status_prop(props, schema))
+    return cols
+
+def _iter_query(token: str, database_id: str, payload: Dict[str,Any], props: Optional[List[str]] = None) -> Iterator[List[Dict[str,Any]]]:
+    """Yield từng trang kết quả (tối đa 100 page) ngay khi nhận được response;
+    trang kế đã được request (prefetch) trong lúc caller xử lý trang này.
+
+    props: chỉ lấy các property id này (filter_properties) thay vì mọi cột của page.
+    """
+    c = get_client(token)
+    url = f"/databases/{database_id}/query"
+    if props:
+        # id property từ API đã được URL-encode sẵn: ghép thẳng vào query string
+        url += "?" + "&".join(f"filter_properties={pid}" for pid in props)
+    def fetch(cursor):
         body = dict(payload)
         if cursor:
             body["start_cursor"] = cursor
-        r = requests.post(url, headers=_headers(token), json=body)
+        r = c.post(url, json=body)
         r.raise_for_status()
-        data = r.json()
-        rows.extend(data.get("results", []))
-        if not data.get("has_more"):
-            break
-        cursor = data.get("next_cursor")
-    if status_equals and not status_prop:
-        kept = []
-        for it in rows:
-            st = _any_status(it.get("properties", {}))
-            if _normalize(st) == _normalize(status_equals):
-                kept.append(it)
-        rows = kept
-    return rows
+        data = decode(r, "pages")
+        STATS.page(database_id, len(data.get("results", [])), len(r.content))
+        return data
+    for data in paginate(fetch):
+        yield data.get("results", [])
+
+def _get_extractor(token: str, database_id: str) -> Extractor:
+    meta = _get_db_meta(token, database_id)
+    cached = _EXTRACTORS.get(database_id)
+    # biên dịch lại nếu metadata đã được làm mới
+    if cached is None or cached[0] is not meta:
+        cached = _EXTRACTORS[database_id] = (meta, compile_extractor(meta["properties"]))
+    return cached[1]
+
+# Kiểu property (không phải status/select) vẫn lọc được server-side theo chuỗi trạng thái
+_TEXT_STATUS_TYPES = ("formula", "rich_text")
+
+def _text_status_filter(col: Dict[str,str], value: str) -> Dict[str,Any]:
+    if col["type"] == "formula":
+        return {"property": col["id"], "formula": {"string": {"equals": value}}}
+    return {"property": col["id"], "rich_text": {"equals": value}}
+
+class StatusPlan(NamedTuple):
+    """Cách lọc theo trạng thái: phần đẩy được lên Notion và phần còn phải kiểm tra ở client."""
+    filter: Optional[Dict[str,Any]]        # filter server-side (None = không lọc)
+    text_cols: List[Dict[str,str]]         # cột formula/rich_text dùng làm trạng thái (kiểm tra lại ở client)
+    want: Optional[str]                    # status_equals đã normalize, None = không lọc
+    nothing: bool                          # chắc chắn không dòng nào khớp -> khỏi query
+
+    def _texts(self, page: Dict[str,Any]) -> Iterator[str]:
+        props = page.get("properties", {})
+        for col in self.text_cols:
+            v = props.get(col["name"]) or {}
+            yield read_formula(v) if col["type"] == "formula" else read_text(v)
+
+    def status_of(self, page: Dict[str,Any]) -> str:
+        """Giá trị khớp status_equals nếu có cột nào khớp, không thì cột đầu tiên có giá trị."""
+        texts = [t for t in self._texts(page) if t]
+        return next((t for t in texts if _normalize(t) == self.want), texts[0] if texts else "")
+
+    def keeps(self, page: Dict[str,Any]) -> bool:
+        if not self.text_cols:
+            return True
+        # cùng ngữ nghĩa với filter "or" phía server: chỉ cần một cột khớp
+        return any(_normalize(t) == self.want for t in self._texts(page))
+
+def plan_status_filter(props: Dict[str,Any], status_prop: Optional[Dict[str,str]], status_equals: Optional[str]) -> StatusPlan:
+    if not status_equals:
+        return StatusPlan(None, [], None, False)
+    want = _normalize(status_equals)
+    if status_prop:
+        operator = status_prop["type"]
+        return StatusPlan({"property": status_prop["id"], operator: {"equals": status_equals}}, [], want, False)
+    # Không có cột status/select: thử các cột formula / rich_text mang tên trạng thái, gộp bằng "or"
+    cols = []
+    for nm in STATUS_CANDS:
+        col = _find_prop_by_name(props, nm, want_types=_TEXT_STATUS_TYPES)
+        if col and col not in cols:
+            cols.append(col)
+    if cols:
+        parts = [_text_status_filter(c, status_equals) for c in cols]
+        return StatusPlan(parts[0] if len(parts) == 1 else {"or": parts}, cols, want, False)
+    # Không cột nào cho ra trạng thái: _any_status luôn rỗng nên chỉ status_equals rỗng mới khớp
+    return StatusPlan(None, [], want, want != "")
+
+class QueryPlan(NamedTuple):
+    status: StatusPlan
+    payload: Dict[str,Any]
+    fallback: Optional[Dict[str,Any]]   # payload dự phòng nếu Notion từ chối filter formula/rich_text
+    props: Optional[List[str]]          # filter_properties: chỉ các cột cell_text / lọc cần
+
+def _projection(token: str, database_id: str, schema: Optional[Dict[str,str]], plan: StatusPlan) -> Optional[List[str]]:
+    """Id các property cần cho Row: cột extractor đã chọn + deadline / status đã resolve."""
+    props = _get_db_props(token, database_id)
+    ex = _get_extractor(token, database_id)
+    deadline_prop, status_prop = _resolve_cols(token, database_id, schema)
+    ids: List[str] = []
+    for steps in ex.fields.values():
+        for key, _, _ in steps:
+            if key in props and props[key].get("id"):
+                ids.append(props[key]["id"])
+    ids += [c["id"] for c in (deadline_prop, status_prop) if c] + [c["id"] for c in plan.text_cols]
+    ids = list(dict.fromkeys(ids))
+    return ids or None
+
+def _plan_query(token: str, database_id: str, schema: Optional[Dict[str,str]], status_equals: Optional[str],
+                deadline_before: Optional[str] = None) -> QueryPlan:
+    deadline_prop, status_prop = _resolve_cols(token, database_id, schema)
+    plan = plan_status_filter(_get_db_props(token, database_id), status_prop, status_equals)
+    filters = []
+    if deadline_before and deadline_prop:
+        filters.append({"property": deadline_prop["id"], "date": {"before": deadline_before}})
+    def payload_for(status_filter):
+        fs = filters + ([status_filter] if status_filter else [])
+        payload = {"page_size": 100}
+        if len(fs) == 1 and not deadline_before:
+            payload["filter"] = fs[0]
+        elif fs:
+            payload["filter"] = {"and": fs}
+        return payload
+    fallback = payload_for(None) if plan.text_cols else None
+    return QueryPlan(plan, payload_for(plan.filter), fallback, _projection(token, database_id, schema, plan))
+
+def _iter_planned(token: str, database_id: str, qp: QueryPlan) -> Iterator[List[Dict[str,Any]]]:
+    # formula không trả về string -> Notion trả 400 cho filter: chạy lại không lọc trạng thái, plan.keeps lọc ở client
+    it = _iter_query(token, database_id, qp.payload, qp.props)
+    try:
+        first = next(it)
+    except StopIteration:
+        return
+    except requests.HTTPError as e:
+        if qp.fallback is None or e.response is None or e.response.status_code != 400:
+            raise
+        yield from _iter_query(token, database_id, qp.fallback, qp.props)
+        return
+    yield first
+    yield from it
+
+def _query_planned(token: str, database_id: str, schema: Optional[Dict[str,str]], status_equals: Optional[str],
+                   deadline_before: Optional[str] = None) -> List[Dict[str,Any]]:
+    qp = _plan_query(token, database_id, schema, status_equals, deadline_before)
+    if qp.status.nothing:
+        return []
+    return [it for batch in _iter_planned(token, database_id, qp) for it in batch if qp.status.keeps(it)]
+
+def query_overdue(token: str, database_id: str, schema: Optional[Dict[str,str]] = None, status_equals: Optional[str] = DEFAULT_STATUS_EQUALS) -> List[Dict[str,Any]]:
+    today_iso = datetime.now(timezone.utc).date().isoformat()
+    return _query_planned(token, database_id, schema, status_equals, deadline_before=today_iso)
 
 # Thêm: truy vấn theo trạng thái (không lọc theo deadline)
 def query_status(token: str, database_id: str, status_equals: Optional[str] = DEFAULT_STATUS_EQUALS) -> List[Dict[str,Any]]:
-    props = _get_db_props(token, database_id)
     # tìm property status giống query_overdue
-    status_prop = None
-    for nm in STATUS_CANDS:
-        status_prop = _find_prop_by_name(props, nm, want_types=("status","select"))
-        if status_prop:
-            break
-    if not status_prop:
-        for name, meta in props.items():
-            if meta.get("type") in ("status","select"):
-                status_prop = {"name": name, "id": meta["id"], "type": meta["type"]}
-                break
-    url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    payload = {"page_size": 100}
-    if status_equals and status_prop:
-        operator = status_prop["type"]
-        payload["filter"] = {"property": status_prop["id"], operator: {"equals": status_equals}}
-    rows: List[Dict[str,Any]] = []
-    cursor = None
-    while True:
-        body = dict(payload)
-        if cursor:
-            body["start_cursor"] = cursor
-        r = requests.post(url, headers=_headers(token), json=body)
-        r.raise_for_status()
-        data = r.json()
-        rows.extend(data.get("results", []))
-        if not data.get("has_more"):
-            break
-        cursor = data.get("next_cursor")
-    # nếu không có status_prop nhưng có status_equals -> lọc client-side
-    if status_equals and not status_prop:
-        kept = []
-        for it in rows:
-            st = _any_status(it.get("properties", {}))
-            if _normalize(st) == _normalize(status_equals):
-                kept.append(it)
-        rows = kept
-    return rows
-
-def build_html(rows: List[Dict[str,Any]]) -> str:
-    if not rows:
-        return "<p>Không có công việc quá hạn 🎉</p>"
-    head = (
-        "<table style=\"border-collapse:collapse;width:100%\">"
-        "<thead><tr>"
-        "<th style='border:1px solid #000;padding:6px'>PIC</th>"
-        "<th style='border:1px solid #000;padding:6px'>Start</th>"
-        "<th style='border:1px solid #000;padding:6px'>Deadline</th>"
-        "<th style='border:1px solid #000;padding:6px'>Trạng thái</th>"
-        "<th style='border:1px solid #000;padding:6px'>Nội dung công việc</th>"
-        "</tr></thead><tbody>"
-    )
-    body = []
-    for it in rows:
-        pic, start, dl, stt, name = cell_text(it.get("properties", {}))
-        body.append(
-            "<tr>"
-            f"<td style='border:1px solid #000;padding:6px'>{pic}</td>"
-            f"<td style='border:1px solid #000;padding:6px'>{start}</td>"
-            f"<td style='border:1px solid #000;padding:6px'>{dl}</td>"
-            f"<td style='border:1px solid #000;padding:6px'>{stt}</td>"
-            f"<td style='border:1px solid #000;padding:6px'>{name}</td>"
-            "</tr>"
-        )
-    return head + "".join(body) + "</tbody></table>"
-
-def send_mail(to_list: List[str], html: str, smtp_cfg: Dict[str,Any]):
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = "Thông báo trễ hạn (Notion)"
-    msg["From"] = smtp_cfg["user"]
-    msg["To"] = ", ".join(to_list)
-    msg.attach(MIMEText(html, "html", "utf-8"))
-    with smtplib.SMTP(smtp_cfg.get("host","smtp.gmail.com"), int(smtp_cfg.get("port",587))) as s:
-        s.starttls()
-        s.login(smtp_cfg["user"], smtp_cfg["pass"])
-        s.sendmail(smtp_cfg["user"], to_list, msg.as_string())
+    return _query_planned(token, database_id, None, status_equals)
+
+def iter_overdue_and_status(token: str, database_id: str, schema: Optional[Dict[str,str]] = None, status_equals: Optional[str] = DEFAULT_STATUS_EQUALS) -> Iterator[Tuple[bool, Row]]:
+    """Stream (quá hạn?, Row) cho từng công việc đang thực hiện.
+
+    Mỗi page được chiếu sang Row ngay khi response về; page gốc không được giữ lại.
+    Mọi dòng quá hạn đều thuộc tập đang thực hiện, nên một lượt query là đủ.
+    """
+    deadline_prop, _ = _resolve_cols(token, database_id, schema)
+    qp = _plan_query(token, database_id, schema, status_equals)
+    if qp.status.nothing:
+        return
+    ex = _get_extractor(token, database_id)
+    today = datetime.now(timezone.utc).date()
+    for batch in _iter_planned(token, database_id, qp):
+        for it in batch:
+            if not qp.status.keeps(it):
+                continue
+            row = _with_text_status(to_row(it, deadline_prop, ex), it, qp.status)
+            # Không có cột deadline -> giống query_overdue: không lọc theo deadline
+            late = not deadline_prop or (row.due is not None and row.due < today)
+            yield late, row
+
+def query_overdue_and_status(token: str, database_id: str, schema: Optional[Dict[str,str]] = None, status_equals: Optional[str] = DEFAULT_STATUS_EQUALS) -> Tuple[List[Row], List[Row]]:
+    """(quá hạn, đang thực hiện) dưới dạng Row, từ một lượt query."""
+    overdue: List[Row] = []
+    in_progress: List[Row] = []
+    for late, row in iter_overdue_and_status(token, database_id, schema, status_equals):
+        in_progress.append(row)
+        if late:
+            overdue.append(row)
+    return overdue, in_progress
+
+def build_html(rows: Iterable[Union[Row, Dict[str,Any]]]) -> str:
+    # vẫn nhận page dict thô (query_overdue / query_status)
+    return table_html((it if isinstance(it, Row) else to_row(it)).cells for it in rows)
+
+def send_mail(to_list: List[str], html: str, smtp_cfg: Dict[str,Any], dispatcher: Optional[MailDispatcher] = None,
+              attachment: Optional[Tuple[str, bytes]] = None):
+    body = build_message("Thông báo trễ hạn (Notion)", smtp_cfg["user"], to_list, html, attachment)
+    started = time.perf_counter()
+    ok = False
+    try:
+        if dispatcher is not None:
+            # dùng lại kết nối SMTP đã login của cả lần chạy
+            dispatcher.send(smtp_cfg["user"], to_list, body)
+        else:
+            with smtplib.SMTP(smtp_cfg.get("host","smtp.gmail.com"), int(smtp_cfg.get("port",587))) as s:
+                s.starttls()
+                s.login(smtp_cfg["user"], smtp_cfg["pass"])
+                s.sendmail(smtp_cfg["user"], to_list, body)
+        ok = True
+    finally:
+        STATS.email(time.perf_counter() - started, len(body), ok)
 
 def load_config_from_env() -> Dict[str, Any]:
     """Load configuration from environment variables"""
@@ -426,54 +785,503 @@ def load_config() -> Dict[str, Any]:
         else:
             raise ValueError("No configuration found in environment variables or JSON file")
 
-def main():
-    try:
-        config = load_config()
-        token_entries = config["notion_tokens"]
-        smtp_cfg = config["smtp"]
-    except Exception as e:
-        print(f"Error loading config: {e}")
-        return
-    
-    sent = 0
-    for idx, t in enumerate(token_entries, 1):
+def _fetch_db(token: str, dbid: str, schema: Optional[Dict[str,str]], status_equals: Optional[str]) -> Tuple[str, List[Row], List[Row]]:
+    # Một lượt query: công việc đang thực hiện, tách phần quá hạn ở client
+    rows, in_progress_rows = query_overdue_and_status(token, dbid, schema=schema, status_equals=status_equals)
+    return _db_title(token, dbid), rows, in_progress_rows
+
+def _match_status(page: Dict[str,Any], status_prop: Optional[Dict[str,str]], plan: StatusPlan, row: Row) -> str:
+    # trạng thái dùng để lọc: cột status đã resolve (như filter server-side), không có thì như plan_status_filter
+    if status_prop:
+        return read_choice(page.get("properties", {}).get(status_prop["name"]) or {})
+    if plan.text_cols:
+        return plan.status_of(page)
+    return row.status
+
+def _fetch_db_incremental(store: RowStore, token: str, dbid: str, schema: Optional[Dict[str,str]], status_equals: Optional[str]) -> Tuple[str, List[Row], List[Row]]:
+    """Chỉ query các page sửa sau lần đồng bộ trước, gộp vào RowStore rồi tính quá hạn / đang thực hiện tại chỗ."""
+    deadline_prop, status_prop = _resolve_cols(token, dbid, schema)
+    props = _get_db_props(token, dbid)
+    ex = _get_extractor(token, dbid)
+    plan = plan_status_filter(props, status_prop, status_equals)
+    scope = f"{dbid}|{_schema_key(schema)}"
+    # trạng thái lưu trong kho (match_status) phụ thuộc status_equals khi trạng thái là cột formula / rich_text
+    if status_equals != DEFAULT_STATUS_EQUALS:
+        scope += f"|{status_equals or ''}"
+    sig = json.dumps(props, sort_keys=True, ensure_ascii=False)
+    state = store.sync_state(scope)
+    started = datetime.now(timezone.utc)
+    # schema đổi -> bản chiếu cũ không còn đúng: đồng bộ lại toàn bộ
+    full = state is None or state["schema_sig"] != sig
+    payload: Dict[str,Any] = {"page_size": 100}
+    if not full:
+        # last_edited_time của Notion làm tròn theo phút: lùi lại một khoảng an toàn
+        since = datetime.fromisoformat(state["synced_at"]) - timedelta(minutes=INCREMENTAL_OVERLAP_MIN)
+        payload["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since.isoformat()}}
+    projected = _projection(token, dbid, schema, plan)
+    def project():
+        for batch in _iter_query(token, dbid, payload, projected):
+            for it in batch:
+                if it.get("archived") or it.get("in_trash"):
+                    continue
+                row = _with_text_status(to_row(it, deadline_prop, ex), it, plan)
+                yield tuple(row) + (_normalize(_match_status(it, status_prop, plan, row)),)
+    # tải hết trước khi ghi: lock / transaction của kho không được giữ trong lúc chờ Notion
+    rows = list(project())
+    reconciled_at = state["reconciled_at"] if state else None
+    if full:
+        store.replace_all(scope, rows)
+        reconciled_at = started.isoformat()
+    else:
+        store.upsert(scope, rows)
+        # page bị archive / xóa không xuất hiện trong query theo last_edited_time:
+        # định kỳ quét danh sách id (chỉ lấy cột title) để dọn
+        if not reconciled_at or started - datetime.fromisoformat(reconciled_at) >= timedelta(hours=RECONCILE_HOURS):
+            title_id = next((m["id"] for m in props.values() if m.get("type") == "title"), None)
+            alive = {it["id"] for batch in _iter_query(token, dbid, {"page_size": 100}, [title_id] if title_id else None) for it in batch}
+            store.keep_only(scope, alive)
+            reconciled_at = started.isoformat()
+    store.mark_synced(scope, started.isoformat(), sig, reconciled_at)
+    want = _normalize(status_equals) if status_equals else None
+    in_progress = [Row(*r[:8]) for r in store.select(scope, want)]
+    today = started.date()
+    # Không có cột deadline -> giống query_overdue: không lọc theo deadline
+    overdue = [r for r in in_progress if not deadline_prop or (r.due is not None and r.due < today)]
+    return _db_title(token, dbid), overdue, in_progress
+
+# (database id, schema override, status_equals): mọi mục config trùng khóa dùng chung một lượt query
+FetchKey = Tuple[str, str, Optional[str]]
+
+class DbReport(NamedTuple):
+    """Kết quả của một database cho một danh sách người nhận."""
+    dbid: str
+    title: str
+    recipients: List[str]
+    overdue: List[Row]
+    in_progress: List[Row]
+    key: FetchKey
+
+class DbJob(NamedTuple):
+    """Một mục databases[] hợp lệ trong config."""
+    token: str
+    raw: str
+    recipients: List[str]
+    schema: Optional[Dict[str,str]]
+    status_equals: Optional[str]
+    max_dbs: Optional[int]
+
+def iter_jobs(token_entries: List[Dict[str,Any]]) -> Iterator[DbJob]:
+    for t in token_entries:
         token = t["token"]
         for db in t.get("databases", []):
             raw = (db.get("id") or "").strip()
             recipients = [x.strip() for x in db.get("recipients", []) if x.strip()]
             if not raw or not recipients:
                 continue
-            schema = db.get("schema") or None
-            status_equals = db.get("status_equals", DEFAULT_STATUS_EQUALS)
+            yield DbJob(token, raw, recipients, db.get("schema") or None,
+                        db.get("status_equals", DEFAULT_STATUS_EQUALS), db.get("max_databases"))
+
+_TOKEN_SLOTS: Dict[str, threading.BoundedSemaphore] = {}
+_TOKEN_SLOTS_LOCK = threading.Lock()
+
+@contextmanager
+def token_slot(token: str) -> Iterator[None]:
+    """Giữ một trong NOTION_WORKERS_PER_TOKEN chỗ của token trong lúc worker dùng nó."""
+    if not NOTION_WORKERS_PER_TOKEN:
+        yield
+        return
+    with _TOKEN_SLOTS_LOCK:
+        sem = _TOKEN_SLOTS.setdefault(token, threading.BoundedSemaphore(NOTION_WORKERS_PER_TOKEN))
+    with sem:
+        yield
+
+def _round_robin(items: List[Any], token_of) -> List[Any]:
+    # xen kẽ các token khi submit: worker đang chờ chỗ của một token không chặn việc của token khác xếp sau
+    by_token: Dict[str, List[Any]] = {}
+    for it in items:
+        by_token.setdefault(token_of(it), []).append(it)
+    queues = list(by_token.values())
+    return [q[i] for i in range(max(map(len, queues), default=0)) for q in queues if i < len(q)]
+
+def _resolve_job(job: DbJob) -> List[str]:
+    with token_slot(job.token):
+        return resolve_db_ids(job.token, job.raw, max_dbs=job.max_dbs)
+
+def _fetch_job(job: DbJob, dbid: str, store: Optional[RowStore] = None) -> Tuple[str, List[Row], List[Row]]:
+    STATS.db(dbid, token=token_key(job.token))
+    # chỗ của token được lấy ở đây (không phải lúc submit) để cả lần thử token dự phòng cũng bị giới hạn
+    with token_slot(job.token), STATS.timed("fetch", dbid), profile(dbid):
+        if store is not None:
+            title, rows, in_progress_rows = _fetch_db_incremental(store, job.token, dbid, job.schema, job.status_equals)
+        else:
+            title, rows, in_progress_rows = _fetch_db(job.token, dbid, job.schema, job.status_equals)
+    STATS.db(dbid, title=title, overdue=len(rows), in_progress=len(in_progress_rows))
+    return title, rows, in_progress_rows
+
+# token không truy cập được database: thử token khác cũng trỏ tới database đó
+_NO_ACCESS = (401, 403, 404)
+
+def fetch_key(job: DbJob, dbid: str) -> FetchKey:
+    return dbid, _schema_key(job.schema), job.status_equals
+
+def plan_fetches(resolved: List[Tuple[DbJob, List[str]]]) -> Tuple[Dict[FetchKey, List[DbJob]], List[Tuple[DbJob, str, FetchKey]]]:
+    """Gom các mục config đã resolve theo database (id đã chuẩn hóa 32-hex).
+
+    Trả về (khóa -> các job có thể query nó, mỗi token một job theo thứ tự config,
+    danh sách (job, dbid, khóa) cần gửi theo thứ tự config, bỏ các cặp trùng database + người nhận).
+    """
+    fetches: Dict[FetchKey, List[DbJob]] = {}
+    targets: List[Tuple[DbJob, str, FetchKey]] = []
+    seen = set()
+    for job, dbids in resolved:
+        for dbid in dbids:
+            key = fetch_key(job, dbid)
+            cands = fetches.setdefault(key, [])
+            if all(j.token != job.token for j in cands):
+                cands.append(job)
+            target = (key, tuple(sorted(job.recipients)))
+            if target in seen:
+                continue
+            seen.add(target)
+            targets.append((job, dbid, key))
+    return fetches, targets
+
+def _fetch_any(jobs: List[DbJob], dbid: str, store: Optional[RowStore] = None) -> Tuple[str, List[Row], List[Row]]:
+    """Query bằng token đầu tiên; 401/403/404 thì thử token kế tiếp."""
+    for i, job in enumerate(jobs):
+        try:
+            return _fetch_job(job, dbid, store)
+        except requests.HTTPError as e:
+            if i == len(jobs) - 1 or e.response is None or e.response.status_code not in _NO_ACCESS:
+                raise
+            print(f"Token #{i + 1} không truy cập được DB {dbid} ({e.response.status_code}), thử token khác")
+    raise ValueError("không có token nào cho DB " + dbid)
+
+def _fetch_failed(dbid: str, e: requests.RequestException):
+    STATS.db(dbid, error=str(e))
+    if isinstance(e, requests.HTTPError):
+        print(f"HTTPError khi query DB {dbid}: {e}")
+    else:
+        # hết retry (timeout/kết nối) hoặc hết request budget của token
+        print(f"Lỗi request khi query DB {dbid}: {e}")
+
+def iter_reports(token_entries: List[Dict[str,Any]], store: Optional[RowStore] = None) -> Iterator[DbReport]:
+    """Stage fetch: resolve + query song song, yield theo đúng thứ tự trong config.
+
+    store: nếu có, dùng chế độ incremental (_fetch_db_incremental).
+    """
+    pool = ThreadPoolExecutor(max_workers=NOTION_WORKERS)
+    try:
+        # resolve toàn bộ config trước, để một database xuất hiện nhiều lần chỉ bị query một lần
+        jobs = list(iter_jobs(token_entries))
+        resolving = {i: pool.submit(_resolve_job, jobs[i])
+                     for i in _round_robin(list(range(len(jobs))), lambda i: jobs[i].token)}
+        resolved = []
+        for i, job in enumerate(jobs):
             try:
-                dbids = resolve_db_ids(token, raw)
+                resolved.append((job, resolving[i].result()))
             except Exception as e:
-                print(f"Skip '{raw}': {e}")
+                print(f"Skip '{job.raw}': {e}")
+        fetches, targets = plan_fetches(resolved)
+        futures = {key: pool.submit(_fetch_any, fetches[key], key[0], store)
+                   for key in _round_robin(list(fetches), lambda k: fetches[k][0].token)}
+        failed = set()
+        for job, dbid, key in targets:
+            try:
+                title, rows, in_progress_rows = futures[key].result()
+            except requests.RequestException as e:
+                if key not in failed:
+                    failed.add(key)
+                    _fetch_failed(dbid, e)
                 continue
-            for dbid in dbids:
-                try:
-                    rows = query_overdue(token, dbid, schema=schema, status_equals=status_equals)
-                except requests.HTTPError as e:
-                    print(f"HTTPError khi query DB {dbid}: {e}")
-                    continue
-                # Lấy thêm các công việc đang thực hiện (không quan tâm deadline)
-                try:
-                    in_progress_rows = query_status(token, dbid, status_equals=status_equals)
-                except requests.HTTPError as e:
-                    print(f"HTTPError khi query status DB {dbid}: {e}")
-                    in_progress_rows = []
-                title = _db_title(token, dbid)
-                # Gộp 2 bảng: quá hạn và đang thực hiện
-                html = f"<h3>Database: {title}</h3>"
-                html += "<h4>Công việc quá hạn</h4>" + build_html(rows)
-                html += "<br><h4>Công việc đang thực hiện</h4>" + build_html(in_progress_rows) + "<br>"
-                try:
-                    send_mail(recipients, html, smtp_cfg)
-                    print(f"Sent. Database: {title} → {', '.join(recipients)}")
-                    sent += 1
-                except Exception as e:
-                    print(f"Gửi mail lỗi cho DB {title}: {e}")
-    print(f"Done. Emails sent: {sent}")
+            yield DbReport(dbid, title, job.recipients, rows, in_progress_rows, key)
+    finally:
+        # dừng giữa chừng (SIGTERM ở daemon, Ctrl+C): bỏ các database còn trong hàng đợi thay vì chờ query hết
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def report_parts(rep: DbReport) -> List[Part]:
+    # Gộp 2 bảng: quá hạn và đang thực hiện
+    return [
+        f"<h3>Database: {escape(rep.title)}</h3>",
+        "<h4>Công việc quá hạn</h4>", Table(f"{rep.title} — quá hạn", [r.cells for r in rep.overdue]),
+        "<br><h4>Công việc đang thực hiện</h4>", Table(f"{rep.title} — đang thực hiện", [r.cells for r in rep.in_progress]),
+        "<br>",
+    ]
+
+def render_mail(parts: List[Part], dbid: Optional[str] = None) -> Tuple[str, Optional[Tuple[str, bytes]]]:
+    """HTML theo MAIL_HTML_BUDGET (+ CSV đính kèm nếu phải tóm tắt)."""
+    with STATS.timed("html", dbid):
+        html, attachment = render(parts)
+    if dbid:
+        STATS.db(dbid, html_bytes=len(html.encode("utf-8")), csv_attached=attachment is not None)
+    return html, attachment
+
+def _notify_key(rep: DbReport, recipients: List[str]) -> str:
+    key = rep.dbid + "|" + ",".join(sorted(recipients))
+    _, schema_key, status_equals = rep.key
+    # schema / status_equals khác mặc định: trạng thái riêng (khóa mặc định giữ nguyên như trước)
+    if schema_key != _schema_key(None) or status_equals != DEFAULT_STATUS_EQUALS:
+        key += f"|{schema_key}|{status_equals or ''}"
+    return key
+
+def _fingerprint(rep: DbReport) -> str:
+    h = hashlib.sha1()
+    for tag, rows in (("o", rep.overdue), ("p", rep.in_progress)):
+        for r in rows:
+            h.update(f"{tag}:{r.page_id}:{r.last_edited_time}\n".encode())
+    return h.hexdigest()
+
+def notification_parts(rep: DbReport, key: str, mode: str) -> Optional[List[Part]]:
+    """Nội dung cần gửi cho một database, hoặc None nếu không có gì mới (mode changed / delta)."""
+    prev = _NOTIFY_STATE.get(key)
+    if mode == "always" or prev is None:
+        return report_parts(rep)
+    if prev.get("fp") == _fingerprint(rep):
+        return None
+    if mode != "delta":
+        return report_parts(rep)
+    before = prev.get("overdue", {})
+    new = [r for r in rep.overdue if r.page_id not in before]
+    now_ids = {r.page_id for r in rep.overdue}
+    resolved = [name for pid, name in before.items() if pid not in now_ids]
+    if not new and not resolved:
+        return None
+    parts: List[Part] = [f"<h3>Database: {escape(rep.title)}</h3>", "<h4>Công việc mới quá hạn</h4>",
+                         Table(f"{rep.title} — mới quá hạn", [r.cells for r in new])]
+    if resolved:
+        parts.append("<br><h4>Không còn quá hạn</h4><ul>" + "".join(f"<li>{escape(n)}</li>" for n in resolved) + "</ul>")
+    return parts
+
+def remember_notification(rep: DbReport, key: str):
+    _NOTIFY_STATE[key] = {"fp": _fingerprint(rep), "overdue": {r.page_id: r.name for r in rep.overdue}}
+
+def load_notify_state(path: str = NOTIFY_STATE_PATH):
+    _NOTIFY_STATE.clear()
+    if not path or not os.path.exists(path):
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            _NOTIFY_STATE.update(json.load(f))
+    except (json.JSONDecodeError, OSError, ValueError) as e:
+        print(f"Warning: Could not load notify state {path}: {e}")
+
+def save_notify_state(path: str = NOTIFY_STATE_PATH):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(_NOTIFY_STATE, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Warning: Could not write notify state {path}: {e}")
+
+def send_report(rep: DbReport, smtp_cfg: Dict[str,Any], dispatcher: MailDispatcher, mode: str = "always") -> bool:
+    key = _notify_key(rep, rep.recipients)
+    parts = notification_parts(rep, key, mode)
+    if parts is None:
+        print(f"Không có thay đổi. Database: {rep.title} → bỏ qua")
+        return False
+    try:
+        html, attachment = render_mail(parts, rep.dbid)
+        send_mail(rep.recipients, html, smtp_cfg, dispatcher, attachment)
+        print(f"Sent. Database: {rep.title} → {', '.join(rep.recipients)}")
+        remember_notification(rep, key)
+        return True
+    except Exception as e:
+        print(f"Gửi mail lỗi cho DB {rep.title}: {e}")
+        return False
+
+def send_reports(reports: Iterable[DbReport], smtp_cfg: Dict[str,Any], dispatcher: MailDispatcher, mode: str = "always") -> int:
+    """Mỗi database một email cho danh sách người nhận của nó (gửi ngay khi có kết quả)."""
+    return sum(send_report(rep, smtp_cfg, dispatcher, mode) for rep in reports)
+
+def send_digest(reports: Iterable[DbReport], smtp_cfg: Dict[str,Any], dispatcher: MailDispatcher, mode: str = "always") -> int:
+    """Mỗi người nhận đúng một email, mỗi database một mục; gửi sau khi đã có kết quả của mọi database."""
+    by_rcpt: Dict[str, List[DbReport]] = {}
+    for rep in reports:
+        for addr in rep.recipients:
+            reps = by_rcpt.setdefault(addr, [])
+            if all(r.key != rep.key for r in reps):
+                reps.append(rep)
+    sent = 0
+    for addr, reps in by_rcpt.items():
+        sections = []
+        for r in reps:
+            key = _notify_key(r, [addr])
+            parts = notification_parts(r, key, mode)
+            if parts is not None:
+                sections.append((r, key, parts))
+        if not sections:
+            print(f"Không có thay đổi cho {addr} → bỏ qua")
+            continue
+        body: List[Part] = []
+        for i, (_, _, parts) in enumerate(sections):
+            body += (["<hr>"] if i else []) + parts
+        try:
+            html, attachment = render_mail(body)
+            send_mail([addr], html, smtp_cfg, dispatcher, attachment)
+            print(f"Sent digest → {addr} ({len(sections)} database)")
+            for r, key, _ in sections:
+                remember_notification(r, key)
+            sent += 1
+        except Exception as e:
+            print(f"Gửi digest lỗi cho {addr}: {e}")
+    return sent
+
+def run_once(config: Dict[str,Any], dispatcher: MailDispatcher, store: Optional[RowStore] = None) -> int:
+    """Một lượt fetch + gửi mail; trả về số email đã gửi."""
+    smtp_cfg = config["smtp"]
+    # Các database được xử lý song song; log và email vẫn theo đúng thứ tự trong config
+    reports = iter_reports(config["notion_tokens"], store)
+    mode = config.get("notify_mode", NOTIFY_MODE)
+    if config.get("digest", DIGEST_MODE):
+        return send_digest(reports, smtp_cfg, dispatcher, mode)
+    return send_reports(reports, smtp_cfg, dispatcher, mode)
+
+def _begin_run():
+    STATS.reset()
+    add_request_hook(STATS.request)
+    reset_budgets()
+
+def _end_run(sent: int):
+    save_notify_state()
+    save_schema_cache()
+    STATS.finish()
+    STATS.write_json()
+    STATS.write_prometheus()
+    print(f"Done. Emails sent: {sent} ({STATS.duration:.1f}s)")
+
+def _start_run(config: Dict[str,Any]) -> Tuple[MailDispatcher, Optional[RowStore]]:
+    _begin_run()
+    clear_db_cache()
+    load_schema_cache()
+    load_notify_state()
+    store = RowStore(ROW_STORE_PATH) if config.get("incremental", INCREMENTAL_MODE) else None
+    return MailDispatcher(config["smtp"]), store
+
+def _finish_run(dispatcher: MailDispatcher, store: Optional[RowStore], sent: int):
+    dispatcher.close()
+    if store is not None:
+        store.close()
+    close_clients()
+    _end_run(sent)
+
+def _load_checked_config() -> Dict[str,Any]:
+    config = load_config()
+    for key in ("notion_tokens", "smtp"):
+        if key not in config:
+            raise KeyError(key)
+    return config
+
+def main():
+    try:
+        config = _load_checked_config()
+    except Exception as e:
+        print(f"Error loading config: {e}")
+        return
+    
+    dispatcher, store = _start_run(config)
+    sent = run_once(config, dispatcher, store)
+    _finish_run(dispatcher, store, sent)
+
+# ---- daemon ----
+class WarmState:
+    """Tài nguyên giữ lại giữa các lần chạy của daemon: config, kết nối SMTP, kho SQLite."""
+
+    def __init__(self):
+        self.config: Optional[Dict[str,Any]] = None
+        self.mtime: Optional[float] = None
+        self.dispatcher: Optional[MailDispatcher] = None
+        self.store: Optional[RowStore] = None
+
+    def reload(self) -> bool:
+        """Nạp (lại) config nếu file config đã đổi; config lỗi thì giữ config cũ. False nếu chưa có config dùng được."""
+        try:
+            mtime = os.path.getmtime(CONFIG_PATH)
+        except OSError:
+            mtime = None
+        if self.config is not None and mtime == self.mtime:
+            return True
+        try:
+            config = _load_checked_config()
+        except Exception as e:
+            print(f"Error loading config: {e}" + (" (giữ config cũ)" if self.config is not None else ""))
+            return self.config is not None
+        if self.config is not None:
+            print("Config đã thay đổi → nạp lại")
+        if self.dispatcher is None or config["smtp"] != self.config["smtp"]:
+            if self.dispatcher is not None:
+                self.dispatcher.close()
+            self.dispatcher = MailDispatcher(config["smtp"])
+        incremental = config.get("incremental", INCREMENTAL_MODE)
+        if incremental and self.store is None:
+            self.store = RowStore(ROW_STORE_PATH)
+        elif not incremental and self.store is not None:
+            self.store.close()
+            self.store = None
+        self.config, self.mtime = config, mtime
+        return True
+
+    def close(self):
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+        if self.store is not None:
+            self.store.close()
+
+def _sleep_until(when: datetime):
+    # ngủ từng đoạn ngắn: chịu được đồng hồ hệ thống bị chỉnh / máy ngủ
+    while True:
+        left = (when - datetime.now(when.tzinfo)).total_seconds()
+        if left <= 0:
+            return
+        time.sleep(min(left, 60))
+
+def _on_sigterm(signum, frame):
+    # SIGTERM lặp lại không được cắt ngang bước lưu cache trong finally
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    sys.exit(0)
+
+def daemon():
+    """Chạy theo lịch NOTION_SCHEDULE; session HTTP, kết nối SMTP, schema / page cache và
+    trạng thái thông báo được giữ trong bộ nhớ giữa các lần chạy."""
+    schedule = CronSchedule(NOTION_SCHEDULE, ZoneInfo(NOTION_SCHEDULE_TZ))
+    # systemd / docker stop gửi SIGTERM: thoát qua finally để đóng kết nối và lưu cache
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    warm = WarmState()
+    clear_db_cache()
+    load_schema_cache()
+    load_notify_state()
+    print(f"Daemon: lịch '{schedule.expr}' ({NOTION_SCHEDULE_TZ})")
+    run_now = NOTION_RUN_ON_START
+    try:
+        while True:
+            if not run_now:
+                nxt = schedule.next_after()
+                print(f"Lần chạy kế tiếp: {nxt.isoformat()}")
+                _sleep_until(nxt)
+            run_now = False
+            if not warm.reload():
+                continue
+            _begin_run()
+            refresh_db_cache()
+            try:
+                sent = run_once(warm.config, warm.dispatcher, warm.store)
+            except Exception as e:
+                # một lần chạy lỗi không được làm dừng daemon
+                print(f"Lần chạy lỗi: {e}")
+                sent = 0
+            _end_run(sent)
+    except (KeyboardInterrupt, SystemExit):
+        print("Daemon dừng")
+    finally:
+        warm.close()
+        save_notify_state()
+        save_schema_cache()
+        close_clients()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if DAEMON_MODE:
+        daemon()
+    else:
+        main()
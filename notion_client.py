@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+notion_client.py — HTTP client dùng chung cho mọi lời gọi Notion API
+
+- Mỗi token một requests.Session (keep-alive, connection pool)
+- Pool size / timeout cấu hình qua environment variables
+- Token bucket theo token (~3 request/giây), tôn trọng Retry-After khi 429,
+  retry có jitter + exponential backoff cho 5xx / timeout
+- Decode JSON bằng msgspec / orjson nếu đã cài (fallback json chuẩn); với msgspec,
+  response query / block children được decode thẳng theo shape cần dùng, bỏ qua field thừa
+- paginate(): gửi request trang kế ngay khi biết next_cursor, trong lúc caller xử lý trang hiện tại
+- add_request_hook(): gọi lại sau mỗi lần gửi request (kể cả lần retry) để đo thời gian / dung lượng
+- Dùng chung bởi main.py và search_database.py
+"""
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple, TypedDict, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com/v1").rstrip("/")
+NOTION_VERSION = "2022-06-28"
+NOTION_POOL_SIZE = int(os.getenv("NOTION_POOL_SIZE", "10"))
+NOTION_CONNECT_TIMEOUT = float(os.getenv("NOTION_CONNECT_TIMEOUT", "10"))
+NOTION_READ_TIMEOUT = float(os.getenv("NOTION_READ_TIMEOUT", "60"))
+NOTION_RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", "3"))        # request/giây mỗi token
+NOTION_RATE_BURST = float(os.getenv("NOTION_RATE_BURST", "3"))
+NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "5"))
+NOTION_BACKOFF_BASE = float(os.getenv("NOTION_BACKOFF_BASE", "0.5"))  # giây
+NOTION_BACKOFF_MAX = float(os.getenv("NOTION_BACKOFF_MAX", "30"))
+NOTION_REQUEST_BUDGET = int(os.getenv("NOTION_REQUEST_BUDGET", "0"))  # tối đa request mỗi token, 0 = không giới hạn
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# auto | msgspec | orjson | json
+NOTION_JSON_DECODER = os.getenv("NOTION_JSON_DECODER", "auto").lower()
+# Prefetch trang kế khi phân trang ("0" để tắt)
+NOTION_PREFETCH = os.getenv("NOTION_PREFETCH", "1").lower() not in ("0", "false", "no")
+
+
+class NotionBudgetExceeded(requests.RequestException):
+    """Token đã dùng hết NOTION_REQUEST_BUDGET trong lần chạy này."""
+
+
+# hook(token, method, url, status | None nếu lỗi kết nối, giây, số byte response, lần thử thứ mấy)
+RequestHook = Callable[[str, str, str, Optional[int], float, int, int], None]
+_request_hooks: List[RequestHook] = []
+
+def add_request_hook(hook: RequestHook):
+    if hook not in _request_hooks:
+        _request_hooks.append(hook)
+
+def _run_hooks(token: str, method: str, url: str, r: Optional[requests.Response], seconds: float, attempt: int):
+    status = r.status_code if r is not None else None
+    nbytes = len(r.content) if r is not None else 0
+    for hook in _request_hooks:
+        hook(token, method, url, status, seconds, nbytes, attempt)
+
+
+def _headers(token: str) -> Dict[str,str]:
+    return {
+        "Authorization": f"Bearer {token}",
+        "Notion-Version": NOTION_VERSION,
+        "Content-Type": "application/json",
+    }
+
+
+class TokenBucket:
+    """Token bucket thread-safe; pause() chặn mọi request tới khi hết Retry-After."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(NOTION_BACKOFF_MAX, NOTION_BACKOFF_BASE * (2 ** attempt)))
+
+def _retry_after(r: requests.Response) -> Optional[float]:
+    try:
+        return max(0.0, float(r.headers.get("Retry-After", "")))
+    except ValueError:
+        return None
+
+
+# ---- JSON decoding ----
+# Shape tối thiểu mà main.py / search_database.py đọc; msgspec bỏ qua mọi field khác
+class _Page(TypedDict, total=False):
+    object: Any
+    id: Any
+    last_edited_time: Any
+    archived: Any
+    in_trash: Any
+    properties: Dict[str, Any]
+
+class _PageList(TypedDict, total=False):
+    results: List[_Page]
+    has_more: Any
+    next_cursor: Any
+
+class _Block(TypedDict, total=False):
+    id: Any
+    type: Any
+    has_children: Any
+    link_to_database: Any
+
+class _BlockList(TypedDict, total=False):
+    results: List[_Block]
+    has_more: Any
+    next_cursor: Any
+
+def _make_decoders(name: str) -> Tuple[str, Dict[Optional[str], Any]]:
+    if name in ("auto", "msgspec") and msgspec is not None:
+        return "msgspec", {
+            None: msgspec.json.Decoder().decode,
+            "pages": msgspec.json.Decoder(_PageList).decode,
+            "blocks": msgspec.json.Decoder(_BlockList).decode,
+        }
+    if name in ("auto", "orjson", "msgspec") and orjson is not None:
+        return "orjson", {None: orjson.loads}
+    return "json", {None: json.loads}
+
+JSON_BACKEND, _DECODERS = _make_decoders(NOTION_JSON_DECODER)
+
+def decode(r: requests.Response, shape: Optional[str] = None) -> Any:
+    """Thay cho r.json(). shape: "pages" (database query) | "blocks" (block children) | None."""
+    dec = _DECODERS.get(shape) or _DECODERS[None]
+    try:
+        return dec(r.content)
+    except ValueError:
+        raise
+    except Exception as e:
+        # msgspec.DecodeError / ValidationError không kế thừa ValueError
+        if shape is not None:
+            return decode(r)
+        raise ValueError(str(e)) from e
+
+
+def paginate(fetch: Callable[[Optional[str]], Dict[str,Any]], prefetch: Optional[bool] = None) -> Iterator[Dict[str,Any]]:
+    """Yield từng response đã decode của một chuỗi phân trang; fetch(cursor) gửi + decode một trang.
+
+    Với prefetch, request trang kế chạy ở thread nền ngay khi trang hiện tại decode xong,
+    nên thời gian caller xử lý kết quả (to_row, lọc...) chồng lên thời gian chờ mạng.
+    """
+    if not (NOTION_PREFETCH if prefetch is None else prefetch):
+        cursor = None
+        while True:
+            data = fetch(cursor)
+            yield data
+            if not data.get("has_more"):
+                return
+            cursor = data.get("next_cursor")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(fetch, None)
+        while pending is not None:
+            data = pending.result()
+            cursor = data.get("next_cursor") if data.get("has_more") else None
+            pending = pool.submit(fetch, cursor) if cursor else None
+            yield data
+
+
+class NotionClient:
+    """Session keep-alive cho một token; headers được dựng một lần.
+
+    Mọi request đi qua token bucket của token; 429/5xx/timeout được retry
+    tối đa NOTION_MAX_RETRIES lần trước khi trả response (hoặc exception) cho caller.
+    """
+
+    def __init__(self, token: str, pool_size: Optional[int] = None,
+                 timeout: Optional[Union[float, Tuple[float,float]]] = None):
+        self.token = token
+        self.timeout = timeout if timeout is not None else (NOTION_CONNECT_TIMEOUT, NOTION_READ_TIMEOUT)
+        size = pool_size or NOTION_POOL_SIZE
+        self.session = requests.Session()
+        self.session.headers.update(_headers(token))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.bucket = TokenBucket(NOTION_RATE_LIMIT, NOTION_RATE_BURST)
+        self.budget = NOTION_REQUEST_BUDGET
+        self.requests_made = 0
+        self.retries = 0
+        self._count_lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        if path.startswith("http"):
+            return path
+        return f"{NOTION_API_URL}/{path.lstrip('/')}"
+
+    def _spend(self):
+        with self._count_lock:
+            if self.budget and self.requests_made >= self.budget:
+                raise NotionBudgetExceeded(f"Đã dùng hết {self.budget} request cho token này")
+            self.requests_made += 1
+
+    def request(self, method: str, path: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        url = self.url(path)
+        attempt = 0
+        while True:
+            self._spend()
+            self.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.Timeout, requests.ConnectionError):
+                if _request_hooks:
+                    _run_hooks(self.token, method, url, None, time.perf_counter() - started, attempt)
+                if attempt >= NOTION_MAX_RETRIES:
+                    raise
+                wait = _backoff(attempt)
+            else:
+                if _request_hooks:
+                    _run_hooks(self.token, method, url, r, time.perf_counter() - started, attempt)
+                if r.status_code not in RETRY_STATUS or attempt >= NOTION_MAX_RETRIES:
+                    return r
+                wait = _retry_after(r) if r.status_code == 429 else None
+                if wait is None:
+                    wait = _backoff(attempt)
+                if r.status_code == 429:
+                    # cả token bị throttle: chặn các thread khác cùng token
+                    self.bucket.pause(wait)
+                r.close()
+            with self._count_lock:
+                self.retries += 1
+            attempt += 1
+            time.sleep(wait)
+
+    def get(self, path: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def reset_budget(self):
+        """Bắt đầu lần chạy mới: đếm lại request / retry (session và bucket được giữ nguyên)."""
+        with self._count_lock:
+            self.requests_made = 0
+            self.retries = 0
+
+    def close(self):
+        self.session.close()
+
+
+_clients: Dict[str, NotionClient] = {}
+_clients_lock = threading.Lock()
+
+def get_client(token: str) -> NotionClient:
+    """Trả về client dùng chung cho token (tạo mới ở lần gọi đầu)."""
+    with _clients_lock:
+        c = _clients.get(token)
+        if c is None:
+            c = _clients[token] = NotionClient(token)
+        return c
+
+def reset_budgets():
+    """NOTION_REQUEST_BUDGET tính theo lần chạy: gọi ở đầu mỗi lần chạy khi client được giữ lại (daemon)."""
+    with _clients_lock:
+        for c in _clients.values():
+            c.reset_budget()
+
+def close_clients():
+    with _clients_lock:
+        for c in _clients.values():
+            c.close()
+        _clients.clear()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+notion_props.py — trích giá trị property đã "biên dịch" theo schema
+
+- Việc chọn cột (tên ứng viên, kiểu, fallback quét toàn bộ props) chỉ làm
+  một lần cho mỗi database; mỗi dòng chỉ còn vài lookup trực tiếp
+- Quy tắc chọn cột nằm ở từng script (main.py, search_database.py); module
+  này chỉ cung cấp cơ chế và các hàm đọc giá trị dùng chung
+"""
+from typing import Dict, Any, List, Tuple, Callable, Optional
+
+# trả None = cột này không có giá trị, thử bước kế (bỏ qua cả stop)
+Reader = Callable[[Dict[str,Any]], Optional[str]]
+# (property key, hàm đọc, dừng kể cả khi giá trị rỗng)
+Step = Tuple[str, Reader, bool]
+
+
+def schema_types(props: Dict[str,Any]) -> Dict[str,str]:
+    """name -> type; dùng được cho cả properties của database lẫn của page."""
+    return {name: (meta or {}).get("type", "") for name, meta in props.items()}
+
+def first_key(types: Dict[str,str], names: List[str], want_types: Optional[Tuple[str,...]] = None) -> Optional[str]:
+    for k in names:
+        t = types.get(k)
+        if t is not None and (want_types is None or t in want_types):
+            return k
+    return None
+
+def keys_of_type(types: Dict[str,str], want_types: Tuple[str,...]) -> List[str]:
+    return [k for k, t in types.items() if t in want_types]
+
+
+# ---- hàm đọc giá trị một property ----
+def read_text(v: Dict[str,Any]) -> str:
+    t = v.get("type")
+    if t in ("title", "rich_text"):
+        return "".join(x.get("plain_text", "") for x in (v.get(t) or []))
+    return ""
+
+def read_people(v: Dict[str,Any]) -> str:
+    ppl = v.get("people") or []
+    if ppl:
+        return ppl[0].get("name") or ppl[0].get("person", {}).get("email", "")
+    return ""
+
+def read_people_listed(v: Dict[str,Any]) -> Optional[str]:
+    """Như read_people, nhưng None khi cột không có người nào: người đầu tiên không có tên / email vẫn cho ""."""
+    return read_people(v) if v.get("people") else None
+
+def read_choice(v: Dict[str,Any]) -> str:
+    """Tên của select / status."""
+    t = v.get("type")
+    return (v.get(t) or {}).get("name", "") if t in ("status", "select") else ""
+
+def read_formula(v: Dict[str,Any]) -> str:
+    """Kết quả formula dạng string."""
+    return (v.get("formula") or {}).get("string") or ""
+
+def read_date10(v: Dict[str,Any]) -> str:
+    s = (v.get("date") or {}).get("start", "")
+    return s[:10] if s else ""
+
+
+class Extractor:
+    """field -> các bước [(key, reader, stop)] đã chọn sẵn từ schema.
+
+    Với mỗi dòng: thử lần lượt từng key, trả giá trị đầu tiên khác rỗng
+    (hoặc giá trị của bước có stop=True, kể cả rỗng).
+    """
+    __slots__ = ("fields", "order")
+
+    def __init__(self, fields: Dict[str, List[Step]], order: Tuple[str,...]):
+        self.fields = fields
+        self.order = order
+
+    def get(self, props: Dict[str,Any], field: str) -> str:
+        for key, read, stop in self.fields[field]:
+            v = props.get(key)
+            if not v:
+                continue
+            val = read(v)
+            if val is None:
+                continue
+            if val or stop:
+                return val
+        return ""
+
+    def extract(self, props: Dict[str,Any]) -> Tuple[str,...]:
+        return tuple(self.get(props, f) for f in self.order)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+row_store.py — kho SQLite cục bộ cho chế độ đồng bộ tăng dần (incremental)
+
+- Lưu bản chiếu của từng page (các cột hiển thị, deadline, trạng thái dùng để lọc)
+- Mỗi "scope" là một database + cách chọn cột (schema override) của nó
+- Lần chạy sau chỉ cần query các page có last_edited_time mới hơn lần đồng bộ trước
+"""
+import sqlite3
+import threading
+from datetime import date
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    scope TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    last_edited_time TEXT,
+    pic TEXT, start TEXT, deadline TEXT, status TEXT, name TEXT,
+    due TEXT,
+    match_status TEXT,
+    PRIMARY KEY (scope, page_id)
+);
+CREATE INDEX IF NOT EXISTS rows_scope_status ON rows (scope, match_status);
+CREATE TABLE IF NOT EXISTS syncs (
+    scope TEXT PRIMARY KEY,
+    synced_at TEXT NOT NULL,
+    schema_sig TEXT,
+    reconciled_at TEXT
+);
+"""
+
+# (page_id, last_edited_time, pic, start, deadline, status, name, due, match_status đã normalize)
+StoredRow = Tuple[str, str, str, str, str, str, str, Optional[date], str]
+
+
+class RowStore:
+    """Một kết nối SQLite dùng chung giữa các worker thread (khóa bằng lock)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+
+    def sync_state(self, scope: str) -> Optional[Dict[str,Any]]:
+        with self.lock:
+            cur = self.conn.execute("SELECT synced_at, schema_sig, reconciled_at FROM syncs WHERE scope = ?", (scope,))
+            r = cur.fetchone()
+        if r is None:
+            return None
+        return {"synced_at": r[0], "schema_sig": r[1], "reconciled_at": r[2]}
+
+    def _insert(self, scope: str, rows: Iterable[StoredRow]):
+        self.conn.executemany(
+            "INSERT INTO rows (scope, page_id, last_edited_time, pic, start, deadline, status, name, due, match_status)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (scope, page_id) DO UPDATE SET last_edited_time = excluded.last_edited_time,"
+            " pic = excluded.pic, start = excluded.start, deadline = excluded.deadline, status = excluded.status,"
+            " name = excluded.name, due = excluded.due, match_status = excluded.match_status",
+            ((scope, pid, let, pic, start, dl, stt, name, due.isoformat() if due else None, match)
+             for pid, let, pic, start, dl, stt, name, due, match in rows),
+        )
+
+    def upsert(self, scope: str, rows: Iterable[StoredRow]):
+        with self.lock, self.conn:
+            self._insert(scope, rows)
+
+    def replace_all(self, scope: str, rows: Iterable[StoredRow]):
+        """Đồng bộ toàn bộ: dòng nào không có trong rows sẽ bị xóa."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM rows WHERE scope = ?", (scope,))
+            self._insert(scope, rows)
+
+    def remove(self, scope: str, page_ids: Iterable[str]):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM rows WHERE scope = ? AND page_id = ?", ((scope, p) for p in page_ids))
+
+    def keep_only(self, scope: str, page_ids: Set[str]) -> int:
+        """Xóa các page không còn trong database (đã archive / xóa). Trả về số dòng đã xóa."""
+        with self.lock:
+            stored = [r[0] for r in self.conn.execute("SELECT page_id FROM rows WHERE scope = ?", (scope,))]
+        gone = [p for p in stored if p not in page_ids]
+        if gone:
+            self.remove(scope, gone)
+        return len(gone)
+
+    def mark_synced(self, scope: str, synced_at: str, schema_sig: str, reconciled_at: Optional[str]):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO syncs (scope, synced_at, schema_sig, reconciled_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (scope) DO UPDATE SET synced_at = excluded.synced_at,"
+                " schema_sig = excluded.schema_sig, reconciled_at = excluded.reconciled_at",
+                (scope, synced_at, schema_sig, reconciled_at),
+            )
+
+    def select(self, scope: str, match_status: Optional[str] = None) -> List[StoredRow]:
+        """Các dòng của scope theo thứ tự lần đầu thấy; lọc theo trạng thái (đã normalize) nếu có."""
+        sql = ("SELECT page_id, last_edited_time, pic, start, deadline, status, name, due, match_status"
+               " FROM rows WHERE scope = ?")
+        args: Tuple[Any,...] = (scope,)
+        if match_status is not None:
+            sql += " AND match_status = ?"
+            args += (match_status,)
+        with self.lock:
+            out = self.conn.execute(sql + " ORDER BY rowid", args).fetchall()
+        return [(pid, let, pic, start, dl, stt, name, date.fromisoformat(due) if due else None, match)
+                for pid, let, pic, start, dl, stt, name, due, match in out]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
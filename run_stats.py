@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+run_stats.py — số liệu của một lần chạy (thời gian, request, retry, dòng, dung lượng)
+
+- Hook cho mọi request Notion (notion_client.add_request_hook), thời gian từng stage
+  (resolve, schema, query, html, smtp) theo database, số trang / dòng / byte của mỗi database
+- Cuối lần chạy ghi báo cáo JSON (NOTION_RUN_REPORT) và, nếu đặt NOTION_PROM_TEXTFILE,
+  file .prom cho textfile collector của node_exporter
+- NOTION_PROFILE_DB=<database id>: profile riêng bước fetch của database đó
+  (NOTION_PROFILER=cprofile mặc định, hoặc pyinstrument nếu đã cài)
+- Token không bao giờ được ghi ra: chỉ dùng 8 ký tự đầu của sha1(token)
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterator, List, Optional
+
+RUN_REPORT_PATH = os.getenv("NOTION_RUN_REPORT", ".notion_run_report.json")
+PROM_TEXTFILE_PATH = os.getenv("NOTION_PROM_TEXTFILE", "")
+PROFILE_DB = os.getenv("NOTION_PROFILE_DB", "").replace("-", "").lower()
+PROFILER = os.getenv("NOTION_PROFILER", "cprofile").lower()
+PROFILE_OUT = os.getenv("NOTION_PROFILE_OUT", "")
+
+_ID_RE = re.compile(r"[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}")
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha1(token.encode()).hexdigest()[:8]
+
+def route_of(method: str, url: str) -> str:
+    """POST https://api.notion.com/v1/databases/<id>/query?... -> "POST /databases/{id}/query"."""
+    path = url.split("?", 1)[0]
+    path = path.split("/v1", 1)[1] if "/v1/" in path else path
+    return f"{method} {_ID_RE.sub('{id}', path)}"
+
+
+class RunStats:
+    """Bộ đếm thread-safe cho một lần chạy; reset() ở đầu mỗi lần chạy."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = datetime.now(timezone.utc)
+            self.t0 = time.perf_counter()
+            self.duration = 0.0
+            self.requests: Dict[str, Dict[str, Dict[str,Any]]] = {}
+            self.stages: Dict[str, float] = {}
+            self.databases: Dict[str, Dict[str,Any]] = {}
+            self.emails = {"sent": 0, "failed": 0, "seconds": 0.0, "bytes": 0}
+
+    # ---- hook request của notion_client ----
+    def request(self, token: str, method: str, url: str, status: Optional[int], seconds: float, nbytes: int, attempt: int):
+        route = route_of(method, url)
+        with self.lock:
+            r = self.requests.setdefault(token_key(token), {}).setdefault(
+                route, {"count": 0, "retries": 0, "errors": 0, "seconds": 0.0, "bytes": 0, "status": {}})
+            r["count"] += 1
+            r["seconds"] += seconds
+            r["bytes"] += nbytes
+            if attempt:
+                r["retries"] += 1
+            code = str(status) if status is not None else "error"
+            r["status"][code] = r["status"].get(code, 0) + 1
+            if status is None or status >= 400:
+                r["errors"] += 1
+
+    # ---- theo database ----
+    def _db(self, dbid: str) -> Dict[str,Any]:
+        return self.databases.setdefault(dbid, {"pages": 0, "rows": 0, "bytes": 0, "seconds": {}})
+
+    def db(self, dbid: str, **fields: Any):
+        with self.lock:
+            self._db(dbid).update(fields)
+
+    def page(self, dbid: str, rows: int, nbytes: int):
+        """Một trang kết quả query của database."""
+        with self.lock:
+            d = self._db(dbid)
+            d["pages"] += 1
+            d["rows"] += rows
+            d["bytes"] += nbytes
+
+    def add(self, stage: str, seconds: float, dbid: Optional[str] = None):
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            if dbid:
+                s = self._db(dbid)["seconds"]
+                s[stage] = s.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, stage: str, dbid: Optional[str] = None) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t, dbid)
+
+    def email(self, seconds: float, nbytes: int, ok: bool):
+        with self.lock:
+            self.stages["smtp"] = self.stages.get("smtp", 0.0) + seconds
+            self.emails["sent" if ok else "failed"] += 1
+            self.emails["seconds"] += seconds
+            self.emails["bytes"] += nbytes
+
+    # ---- báo cáo ----
+    def finish(self):
+        with self.lock:
+            self.duration = time.perf_counter() - self.t0
+
+    def snapshot(self) -> Dict[str,Any]:
+        with self.lock:
+            per_token = {}
+            for tok, routes in self.requests.items():
+                per_token[tok] = {
+                    "requests": sum(r["count"] for r in routes.values()),
+                    "retries": sum(r["retries"] for r in routes.values()),
+                    "seconds": round(sum(r["seconds"] for r in routes.values()), 4),
+                    "bytes": sum(r["bytes"] for r in routes.values()),
+                    "routes": {k: dict(r, seconds=round(r["seconds"], 4), status=dict(r["status"]))
+                               for k, r in routes.items()},
+                }
+            dbs = {k: dict(d, seconds={st: round(v, 4) for st, v in d["seconds"].items()})
+                   for k, d in self.databases.items()}
+            return {
+                "started_at": self.started_at.isoformat(),
+                "duration_seconds": round(self.duration or time.perf_counter() - self.t0, 4),
+                "stages": {k: round(v, 4) for k, v in self.stages.items()},
+                "tokens": per_token,
+                "databases": dbs,
+                "emails": dict(self.emails, seconds=round(self.emails["seconds"], 4)),
+            }
+
+    def write_json(self, path: str = RUN_REPORT_PATH):
+        if not path:
+            return
+        _write_atomic(path, json.dumps(self.snapshot(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path: str = PROM_TEXTFILE_PATH):
+        if not path:
+            return
+        snap = self.snapshot()
+        families: Dict[str, List[str]] = {
+            "run_duration_seconds": [f"{snap['duration_seconds']}"],
+            "run_timestamp_seconds": [f"{self.started_at.timestamp():.0f}"],
+            "stage_seconds": [f'{{stage="{k}"}} {v}' for k, v in snap["stages"].items()],
+            "requests": [], "request_seconds": [], "request_retries": [],
+            "database_rows": [], "database_seconds": [],
+            "emails": [f'{{result="{k}"}} {snap["emails"][k]}' for k in ("sent", "failed")],
+        }
+        for tok, t in snap["tokens"].items():
+            for route, r in t["routes"].items():
+                labels = f'{{token="{tok}",route="{route}"}}'
+                families["requests"].append(f"{labels} {r['count']}")
+                families["request_seconds"].append(f"{labels} {r['seconds']}")
+                families["request_retries"].append(f"{labels} {r['retries']}")
+        for dbid, d in snap["databases"].items():
+            families["database_rows"].append(f'{{database="{dbid}"}} {d["rows"]}')
+            for stage, sec in d["seconds"].items():
+                families["database_seconds"].append(f'{{database="{dbid}",stage="{stage}"}} {sec}')
+        out = []
+        for name, samples in families.items():
+            # mỗi metric: dòng TYPE rồi toàn bộ sample của nó, liền nhau
+            out.append(f"# TYPE notion_mailer_{name} gauge")
+            out += [f"notion_mailer_{name}{x}" if x.startswith("{") else f"notion_mailer_{name} {x}" for x in samples]
+        _write_atomic(path, "\n".join(out) + "\n")
+
+def _write_atomic(path: str, text: str):
+    # textfile collector có thể đọc giữa chừng: ghi file tạm rồi rename
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Warning: Could not write {path}: {e}")
+
+
+@contextmanager
+def profile(dbid: str) -> Iterator[None]:
+    """Profile đoạn code bên trong nếu dbid là NOTION_PROFILE_DB (chỉ thread hiện tại)."""
+    if not PROFILE_DB or dbid.replace("-", "").lower() != PROFILE_DB:
+        yield
+        return
+    if PROFILER == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument chưa được cài, dùng cProfile")
+        else:
+            p = Profiler()
+            p.start()
+            try:
+                yield
+            finally:
+                p.stop()
+                out = PROFILE_OUT or f"notion_profile_{PROFILE_DB}.html"
+                with open(out, 'w', encoding='utf-8') as f:
+                    f.write(p.output_html())
+                print(f"Profile DB {dbid} → {out}")
+            return
+    import cProfile
+    p = cProfile.Profile()
+    p.enable()
+    try:
+        yield
+    finally:
+        p.disable()
+        out = PROFILE_OUT or f"notion_profile_{PROFILE_DB}.prof"
+        p.dump_stats(out)
+        print(f"Profile DB {dbid} → {out} (xem bằng: python -m pstats {out})")
+
+
+STATS = RunStats()
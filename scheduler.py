@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+scheduler.py — lịch kiểu cron (5 trường) cho chế độ daemon của main.py
+
+    phút  giờ  ngày  tháng  thứ        vd. "0 * * * *" (mỗi giờ), "0 16 * * 1-5" (16:00 thứ 2-6)
+
+- Mỗi trường nhận *, số, khoảng a-b, danh sách a,b,c và bước */n hoặc a-b/n
+- Thứ: 0-6 (0 = Chủ nhật, 7 cũng là Chủ nhật)
+- Như cron: nếu cả "ngày" lẫn "thứ" đều bị giới hạn, chỉ cần khớp một trong hai
+"""
+from datetime import datetime, timedelta, tzinfo
+from typing import Optional, Set, Tuple
+
+_FIELDS: Tuple[Tuple[str, int, int], ...] = (
+    ("phút", 0, 59), ("giờ", 0, 23), ("ngày", 1, 31), ("tháng", 1, 12), ("thứ", 0, 7),
+)
+
+
+def _parse_field(spec: str, name: str, lo: int, hi: int) -> Set[int]:
+    out: Set[int] = set()
+    for part in spec.split(","):
+        rng, _, step_s = part.partition("/")
+        step = int(step_s) if step_s else 1
+        if step < 1:
+            raise ValueError(f"Bước không hợp lệ ở trường {name}: {part}")
+        if rng == "*":
+            a, b = lo, hi
+        elif "-" in rng:
+            a_s, b_s = rng.split("-", 1)
+            a, b = int(a_s), int(b_s)
+        else:
+            a = int(rng)
+            b = hi if step_s else a
+        if not (lo <= a <= b <= hi):
+            raise ValueError(f"Giá trị ngoài khoảng {lo}-{hi} ở trường {name}: {part}")
+        out.update(range(a, b + 1, step))
+    return out
+
+
+class CronSchedule:
+    def __init__(self, expr: str, tz: Optional[tzinfo] = None):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Lịch cron cần 5 trường (phút giờ ngày tháng thứ): {expr!r}")
+        self.expr = expr
+        self.tz = tz
+        parsed = [_parse_field(f, *meta) for f, meta in zip(fields, _FIELDS)]
+        self.minutes, self.hours, self.days, self.months, dows = parsed
+        self.dows = {d % 7 for d in dows}
+        self.any_day = fields[2] == "*"
+        self.any_dow = fields[4] == "*"
+
+    def _day_ok(self, dt: datetime) -> bool:
+        day = dt.day in self.days
+        dow = (dt.isoweekday() % 7) in self.dows
+        if self.any_day or self.any_dow:
+            return day and dow
+        return day or dow
+
+    def next_after(self, now: Optional[datetime] = None) -> datetime:
+        """Thời điểm khớp lịch đầu tiên sau now (theo múi giờ của lịch)."""
+        now = now.astimezone(self.tz) if now is not None else datetime.now(self.tz)
+        dt = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # tối đa ~4 năm (29/2)
+        end = dt + timedelta(days=366 * 4)
+        while dt < end:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_ok(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f"Lịch cron không bao giờ khớp: {self.expr!r}")
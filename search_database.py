@@ -1,8 +1,11 @@
 import os, requests, smtplib, json
 from dotenv import load_dotenv
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from html import escape
 from datetime import datetime, timezone
+from notion_client import get_client, close_clients, decode, paginate
+from mailer import MailDispatcher, build_message
+from mail_render import Table, render, table_html
+from notion_props import Extractor, schema_types, read_text, read_people
 
 load_dotenv()
 
@@ -13,60 +16,92 @@ SMTP_PASS = os.getenv("SMTP_PASS")
 for k,v in {"SMTP_USER":SMTP_USER,"SMTP_PASS":SMTP_PASS}.items():
     if not v: raise SystemExit(f"Thiếu {k}")
 
+STATUS_PROP_NAMES = [
+    "Tình trạng công việc trong tuần",
+    "Trạng thái",
+    "Status",
+    "Tiến độ",
+    "Công việc",
+]
+DEADLINE_PROP_NAME = "Deadline dự kiến"
+
+# database id -> database object (GET /databases/{id}), dùng chung cho query_overdue và get_database_title
+_DATABASES = {}
+
+def _normalize(s):
+    return " ".join((s or "").split()).lower()
+
+def _find_prop(props, names, want_types):
+    # giống main._find_prop_by_name: so tên sau khi chuẩn hoá khoảng trắng / hoa thường
+    by_name = {_normalize(k): (k, v) for k, v in props.items()}
+    for nm in names:
+        hit = by_name.get(_normalize(nm))
+        if hit and hit[1].get("type") in want_types:
+            return {"name": hit[0], "id": hit[1]["id"], "type": hit[1]["type"]}
+    return None
+
+def get_database(token, database_id, timeout=None):
+    if database_id in _DATABASES:
+        return _DATABASES[database_id]
+    kwargs = {"timeout": timeout} if timeout else {}
+    r = get_client(token).get(f"/databases/{database_id}", **kwargs)
+    if r.status_code == 401:
+        print(f"401 Unauthorized cho DB {database_id}: token không hợp lệ hoặc không được share quyền.")
+        return None
+    if r.status_code == 404:
+        print(f"404 Not Found cho DB {database_id}: database không tồn tại hoặc token không có quyền truy cập.")
+        return None
+    if r.status_code == 400:
+        print(f"400 Bad Request cho DB {database_id}: kiểm tra lại database id, token, hoặc cấu trúc query.")
+        print(f"Response: {r.text}")
+        return None
+    r.raise_for_status()
+    _DATABASES[database_id] = decode(r)
+    return _DATABASES[database_id]
+
 def query_overdue(token, database_id):
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Notion-Version": "2022-06-28",
-        "Content-Type": "application/json",
-    }
+    # Đọc schema một lần để chọn cột trạng thái / deadline, rồi chạy đúng một query đã lọc
+    db = get_database(token, database_id)
+    if db is None:
+        return []
+    props = db.get("properties", {})
+    status_prop = _find_prop(props, STATUS_PROP_NAMES, ("select", "status"))
+    deadline_prop = _find_prop(props, [DEADLINE_PROP_NAME], ("date",))
+    if not status_prop:
+        print(f"Không tìm thấy property trạng thái phù hợp trong DB {database_id}. Sẽ gửi email với bảng rỗng.")
+        return []
+    if not deadline_prop:
+        print(f"Không tìm thấy property deadline '{DEADLINE_PROP_NAME}' (kiểu date) trong DB {database_id}. Sẽ gửi email với bảng rỗng.")
+        return []
     today_iso = datetime.now(timezone.utc).date().isoformat()
-    url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    prop_names = [
-        "Tình trạng công việc trong tuần",
-        "Trạng thái",
-        "Status",
-        "Tiến độ",
-        "Công việc",
-    ]
-    for prop_name in prop_names:
-        for prop_type in ["select", "status"]:
-            payload = {
-                "filter": {
-                    "and": [
-                        {"property": prop_name, prop_type: {"equals": "Đang thực hiện"}},
-                        {"property": "Deadline dự kiến", "date": {"before": today_iso}}
-                    ]
-                },
-                "page_size": 100
-            }
-            rows, cursor = [], None
-            while True:
-                body = dict(payload)
-                if cursor: body["start_cursor"] = cursor
-                r = requests.post(url, headers=headers, json=body)
-                if r.status_code == 401:
-                    print(f"401 Unauthorized cho DB {database_id}: token không hợp lệ hoặc không được share quyền.")
-                    return []
-                if r.status_code == 404:
-                    print(f"404 Not Found cho DB {database_id}: database không tồn tại hoặc token không có quyền truy cập.")
-                    return []
-                if r.status_code == 400:
-                    # Nếu lỗi property, thử tên khác
-                    err = r.json().get("message", "")
-                    if "Could not find property" in err or "property type" in err:
-                        break
-                    print(f"400 Bad Request cho DB {database_id}: kiểm tra lại database id, token, hoặc cấu trúc query.")
-                    print(f"Response: {r.text}")
-                    return []
-                r.raise_for_status()
-                data = r.json()
-                rows.extend(data.get("results", []))
-                if not data.get("has_more"): break
-                cursor = data.get("next_cursor")
-            if rows:
-                return rows
-    print(f"Không tìm thấy property trạng thái phù hợp trong DB {database_id}. Sẽ gửi email với bảng rỗng.")
-    return []
+    url = f"/databases/{database_id}/query"
+    payload = {
+        "filter": {
+            "and": [
+                {"property": status_prop["id"], status_prop["type"]: {"equals": "Đang thực hiện"}},
+                {"property": deadline_prop["id"], "date": {"before": today_iso}}
+            ]
+        },
+        "page_size": 100
+    }
+    c = get_client(token)
+    def fetch(cursor):
+        body = dict(payload)
+        if cursor: body["start_cursor"] = cursor
+        r = c.post(url, json=body)
+        r.raise_for_status()
+        return decode(r, "pages")
+    rows = []
+    try:
+        for data in paginate(fetch):
+            rows.extend(data.get("results", []))
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 400:
+            raise
+        print(f"400 Bad Request cho DB {database_id}: kiểm tra lại database id, token, hoặc cấu trúc query.")
+        print(f"Response: {e.response.text}")
+        return []
+    return rows
 
 def get_prop_text(props, key):
     v = props.get(key, {})
@@ -164,11 +199,31 @@ def find_date_value(props, keys):
                 return txt
     return ""
 
-def cell_text(prop):
+NAME_KEYS = ["Tên dự án", "Name", "Project name", "Project", "Tên"]
+PIC_KEYS = ["PIC", "Người phụ trách", "Người đảm nhiệm", "Pic"]
+START_KEYS = [
+    "Start date", "Start", "Start Date", "Ngày bắt đầu", "Ngày bắt đầu dự kiến", "Ngày bắt đầu (Start)"
+]
+DL_KEYS = [
+    "Deadline dự kiến", "Deadline", "Due date", "Ngày kết thúc", "Ngày dự kiến kết thúc"
+]
+STATUS_KEYS = [
+    "Tình trạng công việc trong tuần",
+    "Trạng thái",
+    "Status",
+    "Tiến độ",
+    "Trạng thái công việc",
+    "Trạng thái tuần"
+]
+
+def cell_text(prop, ex=None):
+    if ex is not None:
+        pic, start, dl, stt, name = ex.extract(prop)
+        return pic, (start[:10] if start else ""), (dl[:10] if dl else ""), stt, name
     # Nội dung: ưu tiên "Nội dung công việc", fallback sang "Tên dự án"/"Name"/...
     name = get_prop_text(prop, "Nội dung công việc")
     if not name:
-        name = find_property_value(prop, ["Tên dự án", "Name", "Project name", "Project", "Tên"]) or ""
+        name = find_property_value(prop, NAME_KEYS) or ""
     # PIC: thử people trước, fallback vào select/name
     pic = ""
     ppl_prop = prop.get("PIC") or prop.get("Người phụ trách") or prop.get("Người đảm nhiệm") or prop.get("Pic")
@@ -180,54 +235,75 @@ def cell_text(prop):
         else:
             pic = (ppl_prop.get("select",{}) or {}).get("name","") or get_prop_text(prop, "PIC")
     # Start / Deadline: dùng helper để thử nhiều tên/kiểu
-    start_keys = [
-        "Start date", "Start", "Start Date", "Ngày bắt đầu", "Ngày bắt đầu dự kiến", "Ngày bắt đầu (Start)"
-    ]
-    dl_keys = [
-        "Deadline dự kiến", "Deadline", "Due date", "Ngày kết thúc", "Ngày dự kiến kết thúc"
-    ]
-    start = find_date_value(prop, start_keys) or ""
-    dl    = find_date_value(prop, dl_keys) or ""
+    start = find_date_value(prop, START_KEYS) or ""
+    dl    = find_date_value(prop, DL_KEYS) or ""
     # Trạng thái: thử nhiều tên property và kiểu khác nhau
-    status_keys = [
-        "Tình trạng công việc trong tuần",
-        "Trạng thái",
-        "Status",
-        "Tiến độ",
-        "Trạng thái công việc",
-        "Trạng thái tuần"
-    ]
-    stt = find_property_value(prop, status_keys) or ""
+    stt = find_property_value(prop, STATUS_KEYS) or ""
     return pic, (start[:10] if start else ""), (dl[:10] if dl else ""), stt, name
 
-def build_html(rows):
-    if not rows: return "<p>Không có công việc quá hạn 🎉</p>"
-    head = """
-    <table style="border-collapse:collapse;width:100%">
-      <thead><tr>
-        <th style="border:1px solid #000;padding:6px">PIC</th>
-        <th style="border:1px solid #000;padding:6px">Start</th>
-        <th style="border:1px solid #000;padding:6px">Deadline</th>
-        <th style="border:1px solid #000;padding:6px">Trạng thái</th>
-        <th style="border:1px solid #000;padding:6px">Nội dung công việc</th>
-      </tr></thead><tbody>
-    """
-    body = ""
-    for it in rows:
-        pic, start, dl, stt, name = cell_text(it["properties"])
-        body += f"""<tr>
-          <td style="border:1px solid #000;padding:6px">{pic}</td>
-          <td style="border:1px solid #000;padding:6px">{start}</td>
-          <td style="border:1px solid #000;padding:6px">{dl}</td>
-          <td style="border:1px solid #000;padding:6px">{stt}</td>
-          <td style="border:1px solid #000;padding:6px">{name}</td>
-        </tr>"""
-    return head + body + "</tbody></table>"
+# Biên dịch cell_text cho một database: bỏ sẵn các key không có / không đọc được theo kiểu,
+# mỗi dòng chỉ còn thử các cột thật sự có thể cho giá trị
+_VALUE_STOP = ("select", "status", "title", "rich_text", "formula", "rollup")
+_DATE_STOP = ("date", "created_time", "last_edited_time", "formula", "rollup")
+
+def _value_steps(types, keys):
+    steps = []
+    for k in keys:
+        t = types.get(k)
+        if t in _VALUE_STOP:
+            steps.append((k, lambda v, k=k: find_property_value({k: v}, [k]) or "", True))
+        elif t == "people":
+            # như find_property_value: cột people có người (kể cả không tên) là dừng, rỗng thì thử key kế
+            steps.append((k, lambda v, k=k: (find_property_value({k: v}, [k]) or "") if v.get("people") else None, True))
+    return steps
+
+def _date_steps(types, keys):
+    steps = []
+    for k in keys:
+        t = types.get(k)
+        if t in _DATE_STOP or t in ("title", "rich_text"):
+            steps.append((k, lambda v, k=k: find_date_value({k: v}, [k]) or "", t in _DATE_STOP))
+    return steps
+
+def _read_pic(v):
+    if v.get("type") == "people":
+        return read_people(v)
+    return (v.get("select",{}) or {}).get("name","")
+
+def _read_pic_or_text(v):
+    # cột "PIC" không phải people: giống cell_text, fallback sang text của chính cột đó
+    return _read_pic(v) or read_text(v)
 
-def send_mail(html, mail_to):
+def compile_extractor(props):
+    types = schema_types(props)
+    name = []
+    if types.get("Nội dung công việc") in ("title", "rich_text"):
+        name.append(("Nội dung công việc", read_text, False))
+    name += _value_steps(types, NAME_KEYS)
+    pic = []
+    k = next((k for k in PIC_KEYS if k in types), None)
+    if k:
+        pic.append((k, _read_pic_or_text if k == "PIC" else _read_pic, True))
+    return Extractor({"pic": pic, "start": _date_steps(types, START_KEYS), "deadline": _date_steps(types, DL_KEYS),
+                      "status": _value_steps(types, STATUS_KEYS), "name": name},
+                     ("pic", "start", "deadline", "status", "name"))
+
+def table_rows(rows, ex=None):
+    if not rows: return []
+    # cùng database -> cùng schema: biên dịch một lần (từ schema nếu có, không thì từ dòng đầu)
+    if ex is None:
+        ex = compile_extractor(rows[0]["properties"])
+    return [cell_text(it["properties"], ex) for it in rows]
+
+def build_html(rows, ex=None):
+    return table_html(table_rows(rows, ex))
+
+def send_mail(html, mail_to, dispatcher=None, attachment=None):
     """
     mail_to: list[str] hoặc comma-separated string.
     Nếu trống, fallback sang env MAIL_TO (có thể là comma-separated).
+    dispatcher: MailDispatcher dùng chung kết nối SMTP (None = mở kết nối riêng).
+    attachment: (tên file, bytes), vd. CSV khi danh sách quá dài cho email.
     """
     # chuẩn hoá mail_to
     if not mail_to:
@@ -242,34 +318,27 @@ def send_mail(html, mail_to):
     if not isinstance(mail_to, list):
         mail_to = list(mail_to)
 
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = "Thông báo trễ hạn (Notion)"
-    msg["From"] = SMTP_USER
-    msg["To"] = ", ".join(mail_to)
-    msg.attach(MIMEText(html, "html", "utf-8"))
+    msg = build_message("Thông báo trễ hạn (Notion)", SMTP_USER, mail_to, html, attachment)
     try:
+        if dispatcher is not None:
+            dispatcher.send(SMTP_USER, mail_to, msg)
+            return True
         with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
             s.starttls()
             s.login(SMTP_USER, SMTP_PASS)
-            s.sendmail(SMTP_USER, mail_to, msg.as_string())
+            s.sendmail(SMTP_USER, mail_to, msg)
         return True
     except Exception as e:
         print(f"Error sending mail to {mail_to}: {e}")
         return False
 
 def get_database_title(token, database_id):
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Notion-Version": "2022-06-28",
-    }
-    url = f"https://api.notion.com/v1/databases/{database_id}"
     try:
-        r = requests.get(url, headers=headers, timeout=10)
+        data = get_database(token, database_id, timeout=10)
     except Exception:
         return ""
-    if r.status_code != 200:
+    if data is None:
         return ""
-    data = r.json()
     title_field = data.get("title", []) or []
     if isinstance(title_field, list) and title_field:
         parts = []
@@ -289,6 +358,7 @@ if __name__ == "__main__":
         data = json.load(f)
 
     sent_count = 0
+    dispatcher = MailDispatcher({"host": SMTP_HOST, "port": SMTP_PORT, "user": SMTP_USER, "pass": SMTP_PASS})
     for token_obj in data.get("notion_tokens", []):
         token = token_obj["token"]
         for db in token_obj.get("databases", []):
@@ -299,9 +369,12 @@ if __name__ == "__main__":
             if not rows:
                 print(f"Không có công việc quá hạn trong DB {dbid}.")
             db_title = get_database_title(token, dbid) or dbid
-            html = f"<h3>Database: {db_title}</h3>" + build_html(rows)
+            schema = _DATABASES.get(dbid)
+            ex = compile_extractor(schema["properties"]) if schema else None
+            html, attachment = render([f"<h3>Database: {escape(db_title)}</h3>",
+                                       Table(f"{db_title} — quá hạn", table_rows(rows, ex))])
             if recipients or os.getenv("MAIL_TO"):
-                ok = send_mail(html, recipients)
+                ok = send_mail(html, recipients, dispatcher, attachment)
                 if ok:
                     print(f"Sent. Database: {dbid} to {', '.join(recipients) if recipients else os.getenv('MAIL_TO')}")
                     sent_count += 1
@@ -309,4 +382,6 @@ if __name__ == "__main__":
                     print(f"Failed to send. Database: {dbid}")
             else:
                 print(f"No recipients for DB {dbid}; skipped sending.")
+    dispatcher.close()
+    close_clients()
     print(f"Sent. Databases: {sent_count}")
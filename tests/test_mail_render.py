@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+
+from mail_render import COLUMNS, CSV_NAME, EMPTY, Table, csv_bytes, render
+
+
+def rows(n, pic="An", name="Việc"):
+    return [(pic, "2026-09-01", f"2026-10-{i % 28 + 1:02d}", "Đang thực hiện", f"{name} {i}") for i in range(n)]
+
+
+def read_csv(data):
+    assert data.startswith(b"\xef\xbb\xbf")
+    return list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+
+
+def test_under_budget_has_no_attachment():
+    html, att = render(["<h3>A</h3>", Table("A", rows(3)), Table("B", [])], budget=100000)
+    assert att is None
+    assert html.count("<tr>") == 4  # 1 dòng tiêu đề + 3 dòng
+    assert EMPTY in html
+
+
+def test_zero_budget_disables_limit():
+    html, att = render([Table("A", rows(2000))], budget=0)
+    assert att is None
+    assert html.count("<tr>") == 2001
+
+
+def test_values_are_escaped():
+    html, _ = render([Table("A", [("<b>", "", "", "", "a & b")])], budget=0)
+    assert "<td>&lt;b&gt;</td>" in html
+    assert "a &amp; b" in html
+    assert "<b>" not in html
+
+
+def test_over_budget_summarises_largest_table_first():
+    small = Table("nhỏ", rows(5))
+    big = Table("lớn", rows(500, pic="Bình"))
+    html, att = render(["<p>đầu</p>", small, big], budget=20000)
+    assert len(html.encode("utf-8")) <= 20000
+    # bảng nhỏ vẫn đầy đủ, bảng lớn thành tóm tắt theo PIC
+    assert "Việc 4" in html
+    assert "Việc 499" not in html
+    assert "500 công việc" in html
+    assert "<td>Bình</td><td>500</td><td>2026-10-01</td>" in html
+    name, data = att
+    assert name == CSV_NAME
+    got = read_csv(data)
+    assert got[0] == ["Mục"] + list(COLUMNS)
+    assert len(got) == 501
+    assert got[1] == ["lớn", "Bình", "2026-09-01", "2026-10-01", "Đang thực hiện", "Việc 0"]
+
+
+def test_csv_keeps_email_order_of_summarised_tables():
+    first = Table("một", rows(300, pic="A"))
+    second = Table("hai", rows(600, pic="B"))
+    html, att = render([first, "<br>", second], budget=5000)
+    assert "Việc" not in html
+    got = read_csv(att[1])
+    assert [r[0] for r in got[1:]] == ["một"] * 300 + ["hai"] * 600
+
+
+def test_csv_bytes_without_tables_has_header_only():
+    assert read_csv(csv_bytes([])) == [["Mục"] + list(COLUMNS)]
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import os
+from datetime import date
+
+import pytest
+
+os.environ.setdefault("SMTP_USER", "test@example.com")
+os.environ.setdefault("SMTP_PASS", "test")
+
+import main
+from main import DEFAULT_STATUS_EQUALS, DbReport, Row, _notify_key, _schema_key, notification_parts, remember_notification
+from mail_render import Table
+
+DB = "a" * 32
+KEY = (DB, _schema_key(None), DEFAULT_STATUS_EQUALS)
+
+
+def row(pid, let="2026-10-01T00:00:00.000Z", name=None):
+    return Row(pid, let, "An", "2026-09-01", "2026-10-01", "Đang thực hiện", name or pid, date(2026, 10, 1))
+
+
+def report(overdue, in_progress=()):
+    return DbReport(DB, "Dự án <A>", ["x@a.vn"], list(overdue), list(in_progress), KEY)
+
+
+@pytest.fixture(autouse=True)
+def state():
+    main._NOTIFY_STATE.clear()
+    yield main._NOTIFY_STATE
+    main._NOTIFY_STATE.clear()
+
+
+def tables(parts):
+    return [p for p in parts if isinstance(p, Table)]
+
+
+def test_always_sends_full_report():
+    rep = report([row("p1")], [row("p2")])
+    remember_notification(rep, "k")
+    parts = notification_parts(rep, "k", "always")
+    assert [len(t.rows) for t in tables(parts)] == [1, 1]
+
+
+@pytest.mark.parametrize("mode", ["changed", "delta"])
+def test_first_run_sends_full_report(mode):
+    parts = notification_parts(report([row("p1")]), "k", mode)
+    assert [len(t.rows) for t in tables(parts)] == [1, 0]
+
+
+@pytest.mark.parametrize("mode", ["changed", "delta"])
+def test_unchanged_report_is_skipped(mode):
+    remember_notification(report([row("p1")], [row("p2")]), "k")
+    assert notification_parts(report([row("p1")], [row("p2")]), "k", mode) is None
+
+
+def test_changed_sends_full_report_on_edit():
+    remember_notification(report([row("p1")], [row("p2")]), "k")
+    # chỉ sửa một dòng đang thực hiện: last_edited_time đổi -> gửi lại đủ
+    parts = notification_parts(report([row("p1")], [row("p2", let="2026-10-02T00:00:00.000Z")]), "k", "changed")
+    assert [len(t.rows) for t in tables(parts)] == [1, 1]
+
+
+def test_delta_lists_new_and_resolved_overdue():
+    remember_notification(report([row("p1", name="Cũ <1>"), row("p2")]), "k")
+    parts = notification_parts(report([row("p2"), row("p3")]), "k", "delta")
+    assert [t.rows for t in tables(parts)] == [[row("p3").cells]]
+    assert "Dự án &lt;A&gt;" in parts[0]
+    assert parts[-1].endswith("<ul><li>Cũ &lt;1&gt;</li></ul>")
+
+
+def test_delta_without_new_or_resolved_overdue_is_skipped():
+    remember_notification(report([row("p1")], [row("p2")]), "k")
+    # fingerprint đổi (sửa dòng đang thực hiện) nhưng danh sách quá hạn giữ nguyên
+    assert notification_parts(report([row("p1")], [row("p2", let="2026-10-02T00:00:00.000Z")]), "k", "delta") is None
+
+
+def test_delta_only_resolved():
+    remember_notification(report([row("p1")]), "k")
+    parts = notification_parts(report([]), "k", "delta")
+    assert [t.rows for t in tables(parts)] == [[]]
+    assert "<li>p1</li>" in parts[-1]
+
+
+def test_notify_key_separates_variants_only_when_not_default():
+    rep = report([])
+    assert _notify_key(rep, ["y@a.vn", "x@a.vn"]) == DB + "|x@a.vn,y@a.vn"
+    other = rep._replace(key=(DB, _schema_key(None), "Chờ"))
+    assert _notify_key(other, ["x@a.vn"]) == DB + "|x@a.vn|" + _schema_key(None) + "|Chờ"
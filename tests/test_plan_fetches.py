@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+
+os.environ.setdefault("SMTP_USER", "test@example.com")
+os.environ.setdefault("SMTP_PASS", "test")
+
+from main import DEFAULT_STATUS_EQUALS, DbJob, fetch_key, plan_fetches
+
+A = "a" * 32
+B = "b" * 32
+
+
+def job(token, recipients, schema=None, status_equals=DEFAULT_STATUS_EQUALS, raw="db"):
+    return DbJob(token, raw, recipients, schema, status_equals, None)
+
+
+def test_same_database_is_fetched_once_and_sent_per_recipient_list():
+    j1 = job("t1", ["x@a.vn"])
+    j2 = job("t1", ["y@a.vn"])
+    fetches, targets = plan_fetches([(j1, [A]), (j2, [A])])
+    assert list(fetches) == [fetch_key(j1, A)]
+    assert fetches[fetch_key(j1, A)] == [j1]
+    assert targets == [(j1, A, fetch_key(j1, A)), (j2, A, fetch_key(j1, A))]
+
+
+def test_duplicate_recipients_are_sent_once_regardless_of_order():
+    j1 = job("t1", ["x@a.vn", "y@a.vn"])
+    j2 = job("t2", ["y@a.vn", "x@a.vn"])
+    _, targets = plan_fetches([(j1, [A]), (j2, [A])])
+    assert targets == [(j1, A, fetch_key(j1, A))]
+
+
+def test_one_candidate_job_per_token_in_config_order():
+    j1 = job("t1", ["x@a.vn"])
+    j2 = job("t2", ["y@a.vn"])
+    j3 = job("t1", ["z@a.vn"])
+    j4 = job("t3", ["x@a.vn"])
+    fetches, _ = plan_fetches([(j1, [A]), (j2, [A]), (j3, [A]), (j4, [A])])
+    assert fetches[fetch_key(j1, A)] == [j1, j2, j4]
+
+
+def test_schema_and_status_equals_split_the_fetch():
+    j1 = job("t1", ["x@a.vn"])
+    j2 = job("t1", ["x@a.vn"], schema={"deadline": "Hạn"})
+    j3 = job("t1", ["x@a.vn"], status_equals="Chờ")
+    fetches, targets = plan_fetches([(j1, [A]), (j2, [A]), (j3, [A])])
+    assert len(fetches) == 3
+    # cùng người nhận nhưng khác biến thể: vẫn là ba email riêng
+    assert [t[0] for t in targets] == [j1, j2, j3]
+
+
+def test_page_fan_out_keeps_config_order():
+    # một page chứa hai database con
+    page = job("t1", ["x@a.vn"], raw="page")
+    one = job("t2", ["y@a.vn"])
+    fetches, targets = plan_fetches([(page, [A, B]), (one, [A])])
+    assert list(fetches) == [fetch_key(page, A), fetch_key(page, B)]
+    assert fetches[fetch_key(page, A)] == [page, one]
+    assert fetches[fetch_key(page, B)] == [page]
+    assert [(t[0], t[1]) for t in targets] == [(page, A), (page, B), (one, A)]
+
+
+def test_empty_resolution():
+    assert plan_fetches([(job("t1", ["x@a.vn"]), [])]) == ({}, [])
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+import pytest
+
+from row_store import RowStore
+
+
+def row(pid, let="2026-10-01T00:00:00.000Z", name=None, due=None, match="đang thực hiện"):
+    return (pid, let, "An", "2026-09-01", due.isoformat() if due else "", "Đang thực hiện", name or pid, due, match)
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = RowStore(str(tmp_path / "rows.sqlite"))
+    yield s
+    s.close()
+
+
+def test_upsert_keeps_first_seen_order_and_updates(store):
+    store.upsert("db", [row("p1"), row("p2", due=date(2026, 10, 1)), row("p3")])
+    store.upsert("db", [row("p2", let="2026-10-02T00:00:00.000Z", name="sửa"), row("p4")])
+    got = store.select("db")
+    assert [r[0] for r in got] == ["p1", "p2", "p3", "p4"]
+    assert got[1][1] == "2026-10-02T00:00:00.000Z"
+    assert got[1][6] == "sửa"
+    assert got[1][7] is None
+
+
+def test_due_round_trips_as_date(store):
+    store.upsert("db", [row("p1", due=date(2026, 10, 15))])
+    assert store.select("db")[0][7] == date(2026, 10, 15)
+
+
+def test_select_filters_by_match_status(store):
+    store.upsert("db", [row("p1"), row("p2", match="xong"), row("p3")])
+    assert [r[0] for r in store.select("db", "đang thực hiện")] == ["p1", "p3"]
+    assert [r[0] for r in store.select("db", "xong")] == ["p2"]
+
+
+def test_scopes_are_independent(store):
+    store.upsert("a", [row("p1")])
+    store.upsert("b", [row("p1", name="khác"), row("p2")])
+    store.replace_all("a", [row("p9")])
+    assert [r[0] for r in store.select("a")] == ["p9"]
+    assert [r[0] for r in store.select("b")] == ["p1", "p2"]
+
+
+def test_replace_all_drops_missing_rows(store):
+    store.upsert("db", [row("p1"), row("p2")])
+    store.replace_all("db", [row("p2"), row("p3")])
+    assert [r[0] for r in store.select("db")] == ["p2", "p3"]
+
+
+def test_keep_only_removes_archived_pages(store):
+    store.upsert("db", [row("p1"), row("p2"), row("p3")])
+    assert store.keep_only("db", {"p1", "p3"}) == 1
+    assert [r[0] for r in store.select("db")] == ["p1", "p3"]
+    assert store.keep_only("db", {"p1", "p3"}) == 0
+
+
+def test_sync_state_round_trip(tmp_path):
+    path = str(tmp_path / "rows.sqlite")
+    s = RowStore(path)
+    assert s.sync_state("db") is None
+    s.mark_synced("db", "2026-10-01T00:00:00+00:00", "sig1", None)
+    s.mark_synced("db", "2026-10-02T00:00:00+00:00", "sig2", "2026-10-02T00:00:00+00:00")
+    s.upsert("db", [row("p1")])
+    s.close()
+    # dữ liệu còn sau khi mở lại file
+    s = RowStore(path)
+    assert s.sync_state("db") == {"synced_at": "2026-10-02T00:00:00+00:00", "schema_sig": "sig2",
+                                  "reconciled_at": "2026-10-02T00:00:00+00:00"}
+    assert [r[0] for r in s.select("db")] == ["p1"]
+    s.close()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from scheduler import CronSchedule, _parse_field
+
+VN = timezone(timedelta(hours=7))
+
+
+def at(y, mo, d, h=0, mi=0):
+    return datetime(y, mo, d, h, mi, tzinfo=VN)
+
+
+def test_parse_field_forms():
+    assert _parse_field("*", "phút", 0, 5) == {0, 1, 2, 3, 4, 5}
+    assert _parse_field("7", "giờ", 0, 23) == {7}
+    assert _parse_field("1-3,9", "giờ", 0, 23) == {1, 2, 3, 9}
+    assert _parse_field("*/15", "phút", 0, 59) == {0, 15, 30, 45}
+    assert _parse_field("10-20/5", "phút", 0, 59) == {10, 15, 20}
+    # a/n: từ a tới hết khoảng
+    assert _parse_field("50/5", "phút", 0, 59) == {50, 55}
+
+
+@pytest.mark.parametrize("spec", ["60", "5-2", "*/0", "x", "-1"])
+def test_parse_field_rejects(spec):
+    with pytest.raises(ValueError):
+        _parse_field(spec, "phút", 0, 59)
+
+
+def test_needs_five_fields():
+    with pytest.raises(ValueError):
+        CronSchedule("0 * * *")
+
+
+def test_hourly_is_strictly_after_now():
+    s = CronSchedule("0 * * * *", VN)
+    assert s.next_after(at(2026, 10, 17, 9, 0)) == at(2026, 10, 17, 10, 0)
+    assert s.next_after(at(2026, 10, 17, 9, 59)) == at(2026, 10, 17, 10, 0)
+
+
+def test_weekdays_skip_weekend():
+    s = CronSchedule("0 16 * * 1-5", VN)
+    # 17/10/2026 là thứ 7 -> thứ 2 ngày 19
+    assert s.next_after(at(2026, 10, 17, 12)) == at(2026, 10, 19, 16)
+    assert s.next_after(at(2026, 10, 19, 15, 30)) == at(2026, 10, 19, 16)
+
+
+def test_dow_seven_is_sunday():
+    assert CronSchedule("0 8 * * 7", VN).next_after(at(2026, 10, 17)) == at(2026, 10, 18, 8)
+
+
+def test_day_and_dow_are_ored_when_both_restricted():
+    # ngày 1 hoặc Chủ nhật: Chủ nhật 18/10 tới trước ngày 1/11
+    s = CronSchedule("30 8 1 * 0", VN)
+    assert s.next_after(at(2026, 10, 17)) == at(2026, 10, 18, 8, 30)
+    # chỉ giới hạn ngày: phải đúng ngày 1
+    assert CronSchedule("30 8 1 * *", VN).next_after(at(2026, 10, 17)) == at(2026, 11, 1, 8, 30)
+
+
+def test_month_and_year_rollover():
+    s = CronSchedule("0 0 1 1 *", VN)
+    assert s.next_after(at(2026, 10, 17)) == at(2027, 1, 1)
+    assert CronSchedule("0 12 29 2 *", VN).next_after(at(2026, 10, 17)) == at(2028, 2, 29, 12)
+
+
+def test_converts_now_to_schedule_timezone():
+    s = CronSchedule("0 16 * * *", VN)
+    # 08:30 UTC = 15:30 giờ VN
+    nxt = s.next_after(datetime(2026, 10, 19, 8, 30, tzinfo=timezone.utc))
+    assert nxt == at(2026, 10, 19, 16)
+
+
+def test_never_matching_schedule_raises():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *", VN).next_after(at(2026, 10, 17))
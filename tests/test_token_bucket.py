@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import notion_client
+from notion_client import TokenBucket
+
+
+class FakeClock:
+    """Thay module time trong notion_client: sleep() chỉ tăng đồng hồ."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        # như đồng hồ thật: luôn tiến lên, kể cả khi seconds nhỏ hơn độ phân giải của float
+        self.now += max(seconds, 1e-6)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(notion_client, "time", c)
+    return c
+
+
+def test_burst_then_rate(clock):
+    b = TokenBucket(rate=3, burst=3)
+    for _ in range(3):
+        b.acquire()
+    assert clock.slept == []
+    b.acquire()
+    assert clock.now == pytest.approx(1000 + 1 / 3)
+
+
+def test_sustained_rate(clock):
+    b = TokenBucket(rate=3, burst=1)
+    for _ in range(10):
+        b.acquire()
+    # token đầu có sẵn, 9 token sau mỗi cái 1/3 giây
+    assert clock.now - 1000 == pytest.approx(3.0)
+
+
+def test_refill_is_capped_at_burst(clock):
+    b = TokenBucket(rate=3, burst=2)
+    b.acquire()
+    b.acquire()
+    clock.now += 60
+    b.acquire()
+    b.acquire()
+    assert clock.slept == []
+    b.acquire()
+    assert clock.now == pytest.approx(1060 + 1 / 3)
+
+
+def test_pause_blocks_until_retry_after(clock):
+    b = TokenBucket(rate=3, burst=3)
+    b.pause(2.5)
+    b.acquire()
+    assert clock.now == pytest.approx(1002.5)
+    # pause ngắn hơn không rút ngắn lần pause đang có
+    b.pause(5)
+    b.pause(1)
+    b.acquire()
+    assert clock.now == pytest.approx(1007.5)
+
+
+def test_zero_rate_disables_limit(clock):
+    b = TokenBucket(rate=0, burst=1)
+    for _ in range(100):
+        b.acquire()
+    assert clock.slept == []